@@ -25,9 +25,9 @@ This is a Gnome applet to view Yahoo! Weather forecasts.
 Oraje Applet requires:
 
  - gnome python bindings
- - xml.dom (minidom)
+ - xml.parsers.expat
  - json (or simplejson)
- - urllib2
+ - httplib
 
 Optionally dbus is used to support NetworkManager and notifications.
 
@@ -54,18 +54,209 @@ try:
 except:
 	import simplejson as json
 
-try:
-	from xml.dom import minidom
-except:
-	logging.error('mindom is needed to run this application')
-	exit(1)
-
-import urllib2
 from datetime import datetime
 import locale
+import time
+import hashlib
+import shutil
+import signal
+import atexit
+
+import oraje
+from oraje import xdg
+from oraje import metrics
+from oraje import trace
 
 __version__='0.5.1'
 
+class PixbufCache(object):
+	"""In-memory cache of rendered pixbufs.
+
+	Pixbufs are keyed by (file, size), and the least recently used one
+	is evicted when the cache is full.
+
+	Optionally rendered pixbufs are also saved as PNG files in cache_dir,
+	so they can be loaded in later runs without rendering the SVG again.
+	The files are stored in a directory per theme version, determined by
+	the theme file path and its modification time.
+	"""
+
+	def __init__(self, max_size=32, cache_dir=None):
+		self.max_size = max_size
+		self.pixbufs = dict()
+		self.order = []
+
+		self.cache_dir = cache_dir
+		self.theme_dir = None
+
+	def set_theme(self, theme_file):
+		"""Selects the on-disk cache for theme_file.
+
+		Cached files of any other theme version are removed.
+		"""
+
+		if self.cache_dir is None:
+			return
+
+		try:
+			mtime = os.stat(theme_file).st_mtime
+		except OSError as e:
+			logging.error('Failed to stat %s: %s' % (theme_file, e))
+			self.theme_dir = None
+			return
+
+		stamp = hashlib.md5((u'%s:%s' % (theme_file, mtime)).encode('utf-8')
+			).hexdigest()
+		self.theme_dir = os.path.join(self.cache_dir, stamp)
+
+		try:
+			if not os.path.isdir(self.theme_dir):
+				os.makedirs(self.theme_dir)
+
+			for name in os.listdir(self.cache_dir):
+				if name != stamp:
+					logging.debug('Removing outdated icon cache %s' % name)
+					shutil.rmtree(os.path.join(self.cache_dir, name), True)
+		except OSError as e:
+			logging.error('Failed to set up the icon cache: %s' % e)
+			self.theme_dir = None
+
+	def get(self, file, size):
+		"""Returns file rendered at size, rendering it if needed.
+
+		Rendering errors are not cached and are raised to the caller.
+		"""
+
+		key = (file, size)
+		pixbuf = self.pixbufs.get(key)
+
+		if pixbuf is None:
+			metrics.count('pixbuf.misses')
+			pixbuf = self._load(file, size)
+			if len(self.order) >= self.max_size:
+				del self.pixbufs[self.order.pop(0)]
+			self.pixbufs[key] = pixbuf
+		else:
+			metrics.count('pixbuf.hits')
+			self.order.remove(key)
+
+		self.order.append(key)
+		return pixbuf
+
+	def _load(self, file, size):
+		"""Loads file at size from the on-disk cache or renders it.
+		"""
+
+		if self.theme_dir is None:
+			return gtk.gdk.pixbuf_new_from_file_at_size(file, size, size)
+
+		png = os.path.join(self.theme_dir, '%s-%d.png' %
+			(hashlib.md5(file.encode('utf-8')).hexdigest(), size))
+
+		if os.path.exists(png):
+			try:
+				return gtk.gdk.pixbuf_new_from_file(png)
+			except Exception as e:
+				logging.warning('Ignoring broken cached icon %s: %s' %
+					(png, e))
+
+		pixbuf = gtk.gdk.pixbuf_new_from_file_at_size(file, size, size)
+		try:
+			pixbuf.save(png, 'png')
+		except Exception as e:
+			logging.error('Failed to cache %s: %s' % (png, e))
+
+		return pixbuf
+
+
+class Notifier(object):
+	"""Desktop notifications using org.freedesktop.Notifications.
+
+	The D-Bus proxy is kept and only built again when the notification
+	daemon changes (NameOwnerChanged) or a call fails. Each notification
+	replaces the previous one, and bursts are coalesced: after sending a
+	notification, any other in the next window seconds is held back and
+	only the last one is sent. Calls are asynchronous, so the panel
+	doesn't wait for the daemon.
+	"""
+
+	BUS_NAME = 'org.freedesktop.Notifications'
+	OBJECT_PATH = '/org/freedesktop/Notifications'
+
+	def __init__(self, bus, app_name, window=5):
+		self.bus = bus
+		self.app_name = app_name
+		self.window = window
+
+		self.proxy = None
+		self.last_id = 0
+		self.pending = None
+		self.timeout = None
+
+		bus.add_signal_receiver(self.on_owner_changed,
+			signal_name='NameOwnerChanged',
+			dbus_interface='org.freedesktop.DBus',
+			path='/org/freedesktop/DBus', arg0=self.BUS_NAME)
+
+	def interface(self):
+		"""Returns the proxy of the notification daemon.
+		"""
+
+		if self.proxy is None:
+			import dbus
+			self.proxy = dbus.Interface(self.bus.get_object(self.BUS_NAME,
+				self.OBJECT_PATH), self.BUS_NAME)
+		return self.proxy
+
+	def on_owner_changed(self, name, old_owner, new_owner):
+		logging.debug('Notification daemon changed: %s' % new_owner)
+		self.proxy = None
+		# the ids were given by the old daemon
+		self.last_id = 0
+
+	def notify(self, icon, summary, body):
+		"""Sends a notification, or holds it back if one was just sent.
+		"""
+
+		if self.timeout is not None:
+			logging.debug('Notification coalesced')
+			self.pending = (icon, summary, body)
+			return
+
+		self._send(icon, summary, body)
+		self.timeout = gobject.timeout_add(int(self.window*1000), self._flush)
+
+	def _flush(self):
+		self.timeout = None
+		if self.pending is not None:
+			(icon, summary, body) = self.pending
+			self.pending = None
+			self.notify(icon, summary, body)
+		return False
+
+	def _send(self, icon, summary, body):
+		import dbus
+
+		with metrics.timer('notify'):
+			try:
+				self.interface().Notify(self.app_name,
+					dbus.UInt32(self.last_id), icon, summary, body,
+					dbus.Array([], signature='s'),
+					dbus.Dictionary({}, signature='sv'), -1,
+					reply_handler=self._on_reply,
+					error_handler=self._on_error)
+			except dbus.DBusException as e:
+				self._on_error(e)
+
+	def _on_reply(self, id):
+		self.last_id = int(id)
+
+	def _on_error(self, error):
+		logging.error('Failed to send a notification: %s' % error)
+		self.proxy = None
+		self.last_id = 0
+
+
 class OrajeApplet(gnomeapplet.Applet):
 	"""Module that implements gnomeapplet.Applet.
 	"""
@@ -73,22 +264,48 @@ class OrajeApplet(gnomeapplet.Applet):
 	PACKAGE = 'OrajeApplet'
 	VERSION = __version__
 
-	def __init__(self, applet, iid):
+	CONF_DEFAULTS = dict(update='15', units = 'c', location = '32997',
+		theme = '%s/share/OrajeApplet/theme.json' % sys.prefix,
+		notify = False, timeout = '30', connect_timeout = '10',
+		prerender = False, fresh = '60', adaptive = False,
+		update_min = '5', update_max = '60', retry_base = '30',
+		retry_max = '900', breaker_threshold = '5',
+		breaker_cooldown = '1800', locations = [], cycle = '10',
+		workers = '4', api = oraje.YAHOO_API, notify_window = '5')
 
-		self.YAHOO_API = 'http://xml.weather.yahoo.com/forecastrss?w=%s&u=%s'
+	# refresh states
+	REFRESH_IDLE = 0
+	REFRESH_RUNNING = 1
+
+	def __init__(self, applet, iid):
 
 		self.image = None
+		self.pixbufs = PixbufCache(
+			cache_dir=os.path.join(xdg.cache_dir(), 'icons'))
 		self.size = None
 		self.label = None
 
 		self.sybus = None
 		self.sebus = None
-		self.notify = None
+		self.notifier = None
 
 		self.status = None
+		self.current = None
 		self.weather = None
+		self.weathers = dict()
+		self.stale = set()
 		self.timeout = None
-		self.last_fetch = None
+		self.feeds = None
+		self.pool = None
+		self.fetcher = None
+		self.scheduler = None
+		self.breaker = None
+		self.history = None
+		self.trends = dict()
+		self.refresh = self.REFRESH_IDLE
+		self.refresh_waiters = []
+		self.refresh_scheduled = False
+		self.refresh_span = trace.NULL_SPAN
 		self.lc_time = locale.getlocale(locale.LC_TIME)
 
 		self.error = True
@@ -115,9 +332,33 @@ class OrajeApplet(gnomeapplet.Applet):
 		(self.conf_file, self.conf) = self.load_configuration()
 		logging.debug(self.conf)
 
+		feed_cache = oraje.FeedCache(os.path.join(xdg.cache_dir(),
+			'feeds.json'))
+		feed_cache.load()
+		self.feeds = oraje.Fetcher(feed_cache, self.conf['api'],
+			timeout=float(self.conf['timeout']),
+			connect_timeout=float(self.conf['connect_timeout']))
+		self.pool = oraje.FetchPool(int(self.conf['workers']),
+			gobject.idle_add)
+		self.fetcher = oraje.FetchCoordinator(self._fetch_weather, self.pool,
+			int(self.conf['fresh']))
+		self.scheduler = oraje.PollScheduler(int(self.conf['update']),
+			int(self.conf['update_min']), int(self.conf['update_max']),
+			self.conf['adaptive'])
+		self.breaker = oraje.CircuitBreaker(int(self.conf['retry_base']),
+			int(self.conf['retry_max']), int(self.conf['breaker_threshold']),
+			int(self.conf['breaker_cooldown']))
+
+		try:
+			self.history = oraje.History(os.path.join(xdg.data_dir(),
+				'history.db'))
+		except Exception as e:
+			logging.error('Failed to open the history: %s' % e)
+
 		self.theme = self.load_theme(self.conf['theme'])
 		if not self.theme:
 			exit(1)
+		self.pixbufs.set_theme(self.conf['theme'])
 
 		# setup the size of the applet before loading a image
 		self.size = self.applet.get_size()
@@ -136,6 +377,14 @@ class OrajeApplet(gnomeapplet.Applet):
 		self.applet.connect('button-press-event', self.button_press)
 		self.applet.show_all()
 
+		# render the last known conditions while we wait for the network
+		self.load_snapshot()
+		self.prerender_icons()
+
+		if len(self.locations()) > 1:
+			gobject.timeout_add(int(self.conf['cycle'])*1000,
+				self._cycle_location)
+
 		# NM support using DBUS
 		try:
 			import dbus
@@ -155,24 +404,21 @@ class OrajeApplet(gnomeapplet.Applet):
 
 			try:
 				self.sebus = dbus.SessionBus()
+				self.notifier = Notifier(self.sebus, self.PACKAGE,
+					float(self.conf['notify_window']))
 				# we ask for the interface just to check if we have
 				# notifications available
-				self.notify = dbus.Interface(self.sebus.get_object(
-					'org.freedesktop.Notifications',
-					'/org/freedesktop/Notifications'),
-					'org.freedesktop.Notifications')
-				if self.notify is not None:
-					logging.debug('Notification support enabled')
+				self.notifier.interface()
+				logging.debug('Notification support enabled')
 			except:
 				logging.error("Failed to access SessionBus, notifications disabled")
+				self.notifier = None
 
 		if not self.has_nm:
 			# assume we're connected, without NM help
 			self.connection = True
 			self.update_rss()
-			self.timeout = gobject.timeout_add(
-				int(self.conf['update'])*60*1000,
-				update_rss_callback, self)
+			self.schedule_update()
 
 
 	def init_nm(self):
@@ -226,138 +472,226 @@ class OrajeApplet(gnomeapplet.Applet):
 				self.connection = True
 				self.update_rss()
 				if self.timeout is None:
-					self.timeout = gobject.timeout_add(
-						int(self.conf['update'])*60*1000,
-						update_rss_callback, self)
+					self.schedule_update()
 		else:
 			logging.debug('Disconnected')
 			self.connection = False
-			if self.connection:
+			if self.timeout is not None:
 				gobject.source_remove(self.timeout)
 				self.timeout = None
 
 
-	def update_rss(self):
-		"""Update weather data using location and units in user configuration.
+	def schedule_update(self, delay=None):
+		"""(Re)starts the periodic update.
+
+		The current interval is used unless a delay in seconds is
+		provided (ie. retrying after a failure). While the last updates
+		are failing the circuit breaker's delay is kept.
+		"""
+
+		if self.timeout is not None:
+			gobject.source_remove(self.timeout)
+
+		if delay is None:
+			if self.breaker.failures > 0:
+				delay = self.breaker.delay()
+			else:
+				delay = self.scheduler.interval*60
+
+		self.timeout = gobject.timeout_add(int(delay*1000),
+			update_rss_callback, self)
+
+
+	def locations(self):
+		"""Returns the WOEIDs to show, the configured location first.
+		"""
+
+		locations = [self.conf['location']]
+		for woeid in self.conf['locations']:
+			if woeid not in locations:
+				locations.append(woeid)
+		return locations
+
+
+	def update_rss(self, callback=None, scheduled=False):
+		"""Update weather data of all the locations in user configuration.
+
+		The weather is fetched in CANONICAL_UNITS, and converted to the
+		units in user configuration when shown.
+
+		The update runs in the background, callback (if provided) is
+		called from the main loop once it's done. Only scheduled updates
+		are sampled by the adaptive interval.
 		"""
 
-		self._update_rss(self.conf['location'], self.conf['units'])
+		self._update_rss(self.locations(), oraje.CANONICAL_UNITS, callback,
+			scheduled)
 
 
-	def _update_rss(self, w, c):
+	def _update_rss(self, ws, c, callback=None, scheduled=False):
 
 		if not self.connection:
 			logging.warning('_update_rss called on disconnected state')
 			return
 
-		rss = self._get_rss(self.YAHOO_API % (w, c))
-		if rss is None:
-			self.error = True
+		if callback is not None:
+			self.refresh_waiters.append(callback)
+		if scheduled:
+			self.refresh_scheduled = True
+
+		if self.refresh == self.REFRESH_RUNNING:
+			logging.debug('Refresh already running, reusing it')
 			return
 
-		try:
-			self.weather = self.dom_to_weather(minidom.parse(rss))
-			logging.debug(self.weather)
+		if not self.breaker.allow():
+			logging.debug('Update skipped, %s' % self.breaker)
+			self.refresh_scheduled = False
+			waiters = self.refresh_waiters
+			self.refresh_waiters = []
+			for callback in waiters:
+				callback()
+			return
 
-			self.set_status(self.weather['condition']['code'],
-				_(self.theme['conditions'][self.weather['condition']['code']]['desc']).title())
-		except Exception as e:
-			logging.error('Error setting new status: %s' % e)
+		if self.breaker.state == self.breaker.HALF_OPEN:
+			# a single probe request, the other locations are updated
+			# once normal polling is resumed
+			ws = [self.conf['location']]
 
-		rss.close()
-		rss = None
-		self.error = False
+		self.refresh = self.REFRESH_RUNNING
+		self.refresh_span = trace.start('refresh', connected=self.connection,
+			nm=self.has_nm, locations=len(ws))
+		self.fetcher.request_many([(w, c) for w in ws], self._on_weathers,
+			self.refresh_span)
 
 
-	def _get_rss(self, url):
+	def _fetch_weather(self, w, c):
+		"""Download and parse the RSS.
+
+		This runs in a FetchPool worker thread, so it must not touch
+		the UI.
+		"""
 
 		if not self.connection:
 			return None
 
-		try:
-			request = urllib2.Request(url)
-			if self.last_fetch:
-				request.add_header('If-Modified-Since', self.last_fetch)
+		return self.feeds.fetch(w, c)
 
-			rss = urllib2.urlopen(request)
 
-		except urllib2.HTTPError, error: 
-			if error.code == 304:
-				logging.debug('RSS not modified, last_fetch: %s' % 
-					self.last_fetch)
-			else:
-				logging.error('HTTP Error downloading the RSS: %s' % error)
-			return None
-		except urllib2.URLError, error:
-			logging.error('Error downloading the RSS: %s' % error)
-			return None
+	def _on_weathers(self, results):
+		"""Apply the results of a background refresh.
 
-		locale.setlocale(locale.LC_TIME, 'C')
-		self.last_fetch = datetime.utcnow().strftime('%a, %d %b %Y %T GMT')
-		locale.setlocale(locale.LC_TIME, self.lc_time)
-		return rss
+		Called from the main loop with the results of all the locations,
+		so the UI is updated once. It wakes up anyone waiting for the
+		refresh to finish.
 
-	def _translate_wind(self, angle):
+		The update fails only if all the locations failed.
+		"""
 
-		table = [
-			[348.75, 371.25, _('N')],
-			[11.25, 33.75, _('NNE')],
-			[33.75, 56.25, _('NE')],
-			[56.25, 78.75, _('ENE')],
-			[78.75, 101.25, _('E')],
-			[101.25, 123.75, _('ESE')],
-			[123.75, 146.25, _('SE')],
-			[146.25, 168.75, _('SSE')],
-			[168.75, 191.25, _('S')],
-			[191.25, 213.75, _('SSW')],
-			[213.75, 236.25, _('SW')],
-			[236.25, 258.75, _('WSW')],
-			[258.75, 281.25, _('W')],
-			[281.25, 303.75, _('WNW')],
-			[303.75, 326.25, _('NW')],
-			[326.25, 348.75, _('NNW')]
-		]
+		self.refresh = self.REFRESH_IDLE
+		scheduled = self.refresh_scheduled
+		self.refresh_scheduled = False
+		span = self.refresh_span.activate()
+		self.refresh_span = trace.NULL_SPAN
 
-		angle = int(angle)
+		try:
+			self._apply_weathers(results, scheduled, span)
+		finally:
+			span.end()
 
-		# North is a special [348.75, 11.25]
-		if angle <= 11.25:
-			angle += 260
+		# remove the idle source
+		return False
 
-		for i in table:
-			if angle >= i[0] and angle < i[1]:
-				return i[2]
 
-		return '?'
+	def _apply_weathers(self, results, scheduled, span):
 
+		updated = dict()
+		for (w, c), weather in results.items():
+			if weather is None:
+				logging.warning('Failed to update woeid %s' % w)
+			else:
+				updated[w] = weather
+		span.set(updated=len(updated))
 
-	def dom_to_weather(self, dom):
-		"""Translates from Yahoo! Weather XML into Oraje weather dict.
+		if not updated:
+			self.error = True
+			self.breaker.failure()
+			delay = self.breaker.delay()
+			logging.debug('Update failed, %s, retry in %.0fs' %
+				(self.breaker, delay))
+			if self.timeout is not None:
+				self.schedule_update(delay)
+		else:
+			recovered = self.breaker.failures > 0
+			self.breaker.success()
+
+			primary = self.conf['location']
+			self.error = primary not in updated
+			self.stale.difference_update(updated.keys())
+
+			previous = self.weathers.get(self.current)
+			self.weathers.update(updated)
+			logging.debug(self.weathers)
+			self.save_snapshot()
+			self.save_history(updated)
+
+			interval = self.scheduler.interval
+			if scheduled and primary in updated and \
+				self.scheduler.update(updated[primary]) != interval:
+				recovered = True
+			if recovered and self.timeout is not None:
+				self.schedule_update()
+
+			current = self.weathers.get(self.current)
+			notify = previous is None or current is None or \
+				previous['condition']['code'] != current['condition']['code']
+			if self.current is None or current is None:
+				self.current = primary
+			self.show_location(self.current, notify)
+
+		waiters = self.refresh_waiters
+		self.refresh_waiters = []
+		for callback in waiters:
+			callback()
+
+
+	def show_location(self, woeid, notify=True):
+		"""Shows the weather of woeid in the panel.
+
+		Returns False if there's no weather for that location.
 		"""
 
-		YWEATHER_NS = 'http://xml.weather.yahoo.com/ns/rss/1.0'
-		
-		tags = dict(
-			location = ['city', 'country'],
-			units = [ 'temperature', 'distance', 'pressure',
-				'speed' ],
-			wind = [ 'chill', 'direction', 'speed' ],
-			atmosphere = [ 'humidity', 'visibility', 'pressure'
-				,'rising'],
-			astronomy = [ 'sunrise', 'sunset'], 
-			condition = [ 'text', 'code', 'temp', 'date']
-		)
+		weather = self.weathers.get(woeid)
+		if weather is None:
+			return False
+
+		self.current = woeid
+		self.weather = weather
+		try:
+			self.set_status(self.weather['condition']['code'],
+				_(self.theme.desc(self.weather['condition']['code'])).title(),
+				notify=notify)
+		except Exception as e:
+			logging.error('Error setting new status: %s' % e)
+
+		return True
 
-		weather = dict()
 
-		for t in tags.keys():
-			element = dom.getElementsByTagNameNS(YWEATHER_NS, t)
-			node = dict()
-			for n in tags[t]:
-				node[n] = element[0].getAttribute(n)
-			weather[t] = node
+	def _cycle_location(self):
+		"""Shows the next location with weather, called periodically.
+		"""
+
+		locations = self.locations()
+		if self.current in locations:
+			index = locations.index(self.current)
+		else:
+			index = -1
+
+		for i in range(1, len(locations)):
+			woeid = locations[(index + i) % len(locations)]
+			if self.show_location(woeid, notify=False):
+				break
 
-		return weather
+		return True
 
 
 	def load_configuration(self):
@@ -388,9 +722,7 @@ class OrajeApplet(gnomeapplet.Applet):
 		except:
 			conf_fd = None
 			logging.warning('Failed to load %s, using defaults' % conf_file)
-			conf = dict(update='15', units = 'c', location = '32997',
-				theme = '%s/share/OrajeApplet/theme.json' % sys.prefix,
-				notify = False)
+			conf = dict(self.CONF_DEFAULTS)
 		
 		if conf_fd:
 			try:
@@ -405,6 +737,12 @@ class OrajeApplet(gnomeapplet.Applet):
 			logging.info('Configuration <= 0.2, converted')
 			conf['notify'] = False
 
+		# migration for configuration <= 0.5.1
+		for key, value in self.CONF_DEFAULTS.items():
+			if not key in conf:
+				logging.info('Configuration <= 0.5.1, adding %s' % key)
+				conf[key] = value
+
 		return (conf_file, conf)
 
 
@@ -435,25 +773,122 @@ class OrajeApplet(gnomeapplet.Applet):
 		logging.debug("Configuration saved")
 
 
+	def load_snapshot(self):
+		"""Loads and renders the last known weather.
+
+		The snapshot (weather.json) is saved in user's cache directory
+		after every successful update. Only the weather of configured
+		locations is used, and it's marked as stale until the next
+		update.
+		"""
+
+		snapshot_file = os.path.join(xdg.cache_dir(), 'weather.json')
+
+		try:
+			snapshot_fd = open(snapshot_file, 'r')
+		except IOError:
+			logging.debug('No weather snapshot found')
+			return
+
+		try:
+			snapshot = json.load(snapshot_fd)
+		except Exception as e:
+			logging.warning('Ignoring broken weather snapshot %s: %s' %
+				(snapshot_file, e))
+			snapshot = None
+		snapshot_fd.close()
+
+		if snapshot is None:
+			return
+
+		# migration for snapshots with a single location
+		if not 'weathers' in snapshot:
+			snapshot['weathers'] = {snapshot['location']: snapshot['weather']}
+
+		logging.debug('Weather snapshot from %s' %
+			datetime.fromtimestamp(snapshot['saved']))
+
+		for woeid in self.locations():
+			if woeid in snapshot['weathers']:
+				self.weathers[woeid] = snapshot['weathers'][woeid]
+				self.stale.add(woeid)
+
+		if not self.show_location(self.conf['location'], notify=False):
+			logging.debug('Weather snapshot discarded')
+
+
+	def save_snapshot(self):
+		"""Saves current weather as the last known weather.
+		"""
+
+		snapshot_file = os.path.join(xdg.cache_dir(), 'weather.json')
+		snapshot = dict(saved=time.time(), weathers=self.weathers)
+
+		try:
+			snapshot_fd = open('%s.tmp' % snapshot_file, 'w')
+			json.dump(snapshot, snapshot_fd)
+			snapshot_fd.close()
+			os.rename('%s.tmp' % snapshot_file, snapshot_file)
+		except Exception as e:
+			logging.error('Failed to save %s: %s' % (snapshot_file, e))
+
+
+	def save_history(self, weathers):
+		"""Appends the observations to the history and the trends.
+
+		Repeated observations (same condition date) are ignored by the
+		history, so it's safe to call it on every update.
+		"""
+
+		for woeid, weather in weathers.items():
+			try:
+				if self.history:
+					self.history.append(woeid, weather)
+				self.get_trends(woeid).append(weather)
+			except Exception as e:
+				logging.error('Failed to store woeid %s history: %s' %
+					(woeid, e))
+
+
+	def get_trends(self, woeid):
+		"""Returns the recent observations of woeid.
+
+		The first time a location is used its trends are seeded from the
+		history.
+		"""
+
+		if woeid not in self.trends:
+			trends = oraje.Trends()
+			if self.history:
+				try:
+					trends.seed(self.history.last(woeid, trends.size))
+				except Exception as e:
+					logging.error('Failed to read woeid %s history: %s' %
+						(woeid, e))
+			self.trends[woeid] = trends
+
+		return self.trends[woeid]
+
+
 	def load_theme(self, theme_file):
 		"""Loads a theme in JSON format.
+
+		The theme is compiled on first use, and the compiled version is
+		kept in user's cache directory.
 		"""
 
 		logging.debug("Loading theme: %s" % theme_file)
 
 		try:
-			theme_fd = open(theme_file, 'r')
-		except:
+			theme = oraje.Theme.load(theme_file,
+				os.path.join(xdg.cache_dir(), 'theme.compiled'))
+		except (IOError, OSError) as e:
 			# this is fatal
-			logging.error('Failed to load theme.json')
+			logging.error('Failed to load theme.json: %s' % e)
 			return None
-		
-		try:
-			theme = json.load(theme_fd)
-		except Exception as e:
+		except ValueError as e:
 			logging.error('parsing error in theme.json: %s' % e)
 			exit(1)
-		theme_fd.close()
 
 		return theme
 
@@ -462,18 +897,23 @@ class OrajeApplet(gnomeapplet.Applet):
 		"""Translate status code into status string.
 		"""
 
-		return self.theme['conditions'][self.status]['status']
+		return self.theme.status(self.status)
 
 
-	def set_status(self, status, desc=None, force=False):
+	@metrics.timed('set_status')
+	@trace.traced('set_status')
+	def set_status(self, status, desc=None, force=False, notify=True):
 		"""Sets the status checking it's supported by current theme.
+
+		A notification is sent on status change only if notify is True.
 		"""
 	
 		logging.debug('Status request: %s', status)
 
 		new = False
 
-		if status in self.theme['conditions']:
+		if self.theme.has(status):
+			status = int(status)
 			if status != self.status or force:
 				self.status = status
 				logging.debug('Status changed')
@@ -483,39 +923,36 @@ class OrajeApplet(gnomeapplet.Applet):
 			return
 
 		if self.weather is not None:
+			weather = oraje.convert_units(self.weather, self.conf['units'])
 			temp = ' %s°%c' % (
-				self.weather['condition']['temp'],
-				self.weather['units']['temperature']
+				weather['condition']['temp'],
+				weather['units']['temperature']
 			)
 			self.label.set_markup(temp)
 
 			# prettify
 			if not desc:
-				desc = self.theme['conditions'][self.status]['desc']
+				desc = self.theme.desc(self.status)
 			desc = desc.title()
 
 			tip = '%s (%s)\n<b>%s</b>,%s' % (
-				self.weather['location']['city'], 
-				self.weather['location']['country'],
+				weather['location']['city'], 
+				weather['location']['country'],
 				desc,
 				temp
 			)
+			if self.current in self.stale:
+				tip += '\n<small><i>%s</i></small>' % \
+					_('Last known conditions')
 			self.label.set_tooltip_markup(tip)
 
-			if self.notify is not None and self.conf['notify'] and new:
+			if self.notifier is not None and self.conf['notify'] and new \
+				and notify:
 				logging.debug('Sending a notification of new coditions')
-
-				# the object can be invalid after some time, so ask for a
-				# new interface
-				import dbus
-				self.notify = dbus.Interface(self.sebus.get_object(
-					'org.freedesktop.Notifications',
-					'/org/freedesktop/Notifications'),
-					'org.freedesktop.Notifications')
-				self.notify.Notify(self.PACKAGE, 0, 
-					'file://%s%s' % (self.theme['base'],
-						self.theme['status'][self.status_str]),
-					_('New conditions'), tip, '', '', -1)
+				with trace.span('notify'):
+					self.notifier.notify(
+						'file://%s' % self.theme.icon(self.status),
+						_('New conditions'), tip)
 		else:
 			tip = '...'
 
@@ -524,13 +961,14 @@ class OrajeApplet(gnomeapplet.Applet):
 			prev = self.image
 
 		if new:
-			self.image = self.load_image('%s%s' % 
-				(self.theme['base'], self.theme['status'][self.status_str]),
-					self.size, prev)
+			self.image = self.load_image(self.theme.icon(self.status),
+				self.size, prev)
 
 		self.image.set_tooltip_markup(tip)
 
 
+	@metrics.timed('load_image')
+	@trace.traced('load_image')
 	def load_image(self, file, size, prev = None):
 		"""Load a image into a gtk.Image.
 	
@@ -547,7 +985,7 @@ class OrajeApplet(gnomeapplet.Applet):
 			image = gtk.Image()
 
 		try:
-			pixbuf = gtk.gdk.pixbuf_new_from_file_at_size(file, size, size)
+			pixbuf = self.pixbufs.get(file, size)
 			image.set_from_pixbuf(pixbuf)
 		except Exception as e:
 			logging.error('Failed to load %s: %s' % (file, e))
@@ -562,6 +1000,41 @@ class OrajeApplet(gnomeapplet.Applet):
 		logging.debug('Change size callback')
 		self.size = size
 		self.set_status(self.status, force=True)
+		self.prerender_icons()
+
+
+	def prerender_icons(self):
+		"""Render all the status icons at panel size when idle.
+
+		Only if enabled in user configuration (prerender). Once done,
+		status changes are served from the pixbuf cache.
+		"""
+
+		if not self.conf['prerender']:
+			return
+
+		files = list(self.theme.icons)
+		gobject.idle_add(self._prerender_icon, files, self.size)
+
+
+	def _prerender_icon(self, files, size):
+		"""Render one of the pending icons, called when idle.
+		"""
+
+		if size != self.size:
+			# the panel changed size meanwhile, there's a new pre-render
+			return False
+
+		file = files.pop()
+		try:
+			self.pixbufs.get(file, size)
+		except Exception as e:
+			logging.error('Failed to pre-render %s: %s' % (file, e))
+
+		if not files:
+			logging.debug('Icons pre-rendered at size %d' % size)
+			return False
+		return True
 
 
 	def change_background(self, applet, type, color, pixmap):
@@ -600,14 +1073,8 @@ class OrajeApplet(gnomeapplet.Applet):
 			return
 
 		if self.connection:
-			if self.timeout is not None:
-				gobject.source_remove(self.timeout)
-
 			self.update_rss()
-
-			self.timeout = gobject.timeout_add(
-				int(self.conf['update'])*60*1000,
-				update_rss_callback, self)
+			self.schedule_update()
 
 
 	def on_preferences(self, component, verb):
@@ -630,12 +1097,13 @@ class OrajeApplet(gnomeapplet.Applet):
 		woeid.set_text(self.conf['location'])
 
 		location = ui.get_object('location')
-		if self.error or self.weather is None:
+		weather = self.weathers.get(self.conf['location'])
+		if self.error or weather is None:
 			location.set_markup('')
 		else:
 			location.set_markup('<small><i>%s (%s)</i></small>' % 
-				(self.weather['location']['city'], 
-				self.weather['location']['country']))
+				(weather['location']['city'], 
+				weather['location']['country']))
 
 		woeid.connect('focus-out-event', self.on_woeid_change, location)
 
@@ -654,7 +1122,7 @@ class OrajeApplet(gnomeapplet.Applet):
 
 		notify = ui.get_object('notify')
 		notify.set_active(self.conf['notify'])
-		if self.notify is not None:
+		if self.notifier is not None:
 			notify.connect('toggled', self.on_notify_toggle)
 		else:
 			notify.set_sensitive(False)
@@ -682,33 +1150,48 @@ class OrajeApplet(gnomeapplet.Applet):
 			logging.debug('woeid changed, checking')
 			label.set_markup(_('<small><i>Checking...</i></small>'))
 
-			rss = self._get_rss(self.YAHOO_API % (woeid, self.conf['units']))
-			if rss is None:
-				logging.warning('Failed to get the RSS, woeid %s' % woeid)
-				label.set_markup(_('<small><b>Error retrieving location</b></small>'))
-				return
-
-			try:
-				weather = self.dom_to_weather(minidom.parse(rss))
-			except:
-				logging.warning('Failed to parse the RSS, woeid %s' % woeid)
-				label.set_markup(_('<small><b>Error processing the location</b></small>'))
-				return
-
+			self.fetcher.request(woeid, oraje.CANONICAL_UNITS,
+				lambda weather: self._on_woeid_checked(woeid, weather,
+					label))
+		elif self.conf['location'] in self.weathers:
+			# in case there was a previous error, don't confuse
+			# the user if he puts the old WOID back
+			weather = self.weathers[self.conf['location']]
 			label.set_markup('<small><i>%s (%s)</i></small>' % 
 				(weather['location']['city'], 
 				weather['location']['country']))
 
-			self.weather = weather
-			self.conf['location'] = woeid
-			self.set_status(self.weather['condition']['code'],
-				_(self.theme['conditions'][self.weather['condition']['code']]['desc']).title())
-		elif self.weather is not None:
-			# in case there was a previous error, don't confuse
-			# the user if he puts the old WOID back
-			label.set_markup('<small><i>%s (%s)</i></small>' % 
-				(self.weather['location']['city'], 
-				self.weather['location']['country']))
+
+	def _on_woeid_checked(self, woeid, weather, label):
+		"""Apply the result of checking a new WOEID.
+
+		The Preferences dialog may be closed by the time the check
+		finishes, in that case the configuration is saved here.
+		"""
+
+		if weather is None:
+			logging.warning('Failed to get the RSS, woeid %s' % woeid)
+			if self.prefs:
+				label.set_markup(_('<small><b>Error retrieving location</b></small>'))
+			return False
+
+		if self.prefs:
+			label.set_markup('<small><i>%s (%s)</i></small>' %
+				(weather['location']['city'],
+				weather['location']['country']))
+
+		self.weathers[woeid] = weather
+		self.error = False
+		self.stale.discard(woeid)
+		self.conf['location'] = woeid
+		self.save_snapshot()
+		self.save_history({woeid: weather})
+		self.show_location(woeid)
+
+		if not self.prefs:
+			self.save_configuration()
+
+		return False
 
 
 	def on_interval_change(self, spin, event):
@@ -720,21 +1203,17 @@ class OrajeApplet(gnomeapplet.Applet):
 		if interval != self.conf['update']:
 			logging.debug('interval changed')
 			self.conf['update'] = interval
+			self.scheduler.set_base(int(interval))
 			if self.connection:
-				if self.timeout is not None:
-					gobject.source_remove(self.timeout)
-				self.timeout = gobject.timeout_add(
-					int(self.conf['update'])*60*1000, 
-					update_rss_callback, self)
+				self.schedule_update()
 
 
 	def on_units_change(self, combo):
 		"""Manage units change.
 
 		Yahoo! Weather uses metric units when Celsius data is requested,
-		so we only have to deal with Celsius and Fahrenheit.
-
-		FIXME: use Fahrenheit and make the conversion internally.
+		so we only have to deal with Celsius and Fahrenheit. The weather
+		is converted locally, so there's no need to update it.
 		"""
 
 		logging.debug('Preferences, on_units_change')
@@ -747,10 +1226,8 @@ class OrajeApplet(gnomeapplet.Applet):
 		if units != self.conf['units']:
 			logging.debug('units changed')
 			self.conf['units'] = units
-			# FIXME: not needed if we were using one type of unit
-			# internally and converting it before showing it to the user
-			if self.connection:
-				self.update_rss()
+			if self.weather is not None:
+				self.set_status(self.status)
 
 
 	def on_notify_toggle(self, togglebutton):
@@ -792,33 +1269,34 @@ class OrajeApplet(gnomeapplet.Applet):
 		about.destroy()
 		self.about = None
 
+	@metrics.timed('set_details')
 	def _set_details(self, ui):
 
 		logging.debug('Setting details')
 
 		image = ui.get_object('image')
-		self.load_image('%s%s' % 
-			(self.theme['base'], self.theme['status'][self.status_str]),
-				96, image)
+		self.load_image(self.theme.icon(self.status), 96, image)
 
 		if self.weather is None:
 			logging.warning('no weather info available')
 			return
 
+		weather = oraje.convert_units(self.weather, self.conf['units'])
+
 		conditions = ui.get_object('conditions')
-		conditions.set_markup(_(self.theme['conditions'][self.weather['condition']['code']]['desc']).title())
+		conditions.set_markup(_(self.theme.desc(weather['condition']['code'])).title())
 		temperature = ui.get_object('temperature')
 		temperature.set_markup('<big><b>%s°%c</b></big>' % (
-				self.weather['condition']['temp'],
-				self.weather['units']['temperature']))
+				weather['condition']['temp'],
+				weather['units']['temperature']))
 
 		location = ui.get_object('location')
 		location.set_text('%s (%s)' % 
-				(self.weather['location']['city'], 
-				self.weather['location']['country']))
+				(weather['location']['city'], 
+				weather['location']['country']))
 
 		date = ui.get_object('date')
-		datestr = self.weather['condition']['date']
+		datestr = weather['condition']['date']
 		locale.setlocale(locale.LC_TIME, 'C')
 		datestr = datetime.strptime(datestr, '%a, %d %b %Y %I:%M %p %Z')
 		locale.setlocale(locale.LC_TIME, self.lc_time)
@@ -827,52 +1305,82 @@ class OrajeApplet(gnomeapplet.Applet):
 
 		chill = ui.get_object('chill')
 		chill.set_markup('%s°%c' % (
-			self.weather['wind']['chill'],
-			self.weather['units']['temperature']))
+			weather['wind']['chill'],
+			weather['units']['temperature']))
 
 		pressure = ui.get_object('pressure')
 		pressure.set_text('%s %s' % (
-			self.weather['atmosphere']['pressure'],
-			self.weather['units']['pressure']))
+			weather['atmosphere']['pressure'],
+			weather['units']['pressure']))
 
 		humidity = ui.get_object('humidity')
-		humidity.set_text('%s%%' % self.weather['atmosphere']['humidity'])
+		humidity.set_text('%s%%' % weather['atmosphere']['humidity'])
 
 		visibility = ui.get_object('visibility')
 		visibility.set_text('%s %s' % (
-			self.weather['atmosphere']['visibility'],
-			self.weather['units']['distance']))
+			weather['atmosphere']['visibility'],
+			weather['units']['distance']))
 
-		direction = self.weather['wind']['direction']
-		direction = self._translate_wind(direction)
+		direction = weather['wind']['direction']
+		direction = oraje.translate_wind(direction)
 
 		wind = ui.get_object('wind')
 		wind.set_text('%s %s %s' % (
 			direction,
-			self.weather['wind']['speed'],
-			self.weather['units']['speed']))
+			weather['wind']['speed'],
+			weather['units']['speed']))
 
 		sunrise = ui.get_object('sunrise')
-		sunrise.set_text(self.weather['astronomy']['sunrise'])
+		sunrise.set_text(weather['astronomy']['sunrise'])
 
 		sunset = ui.get_object('sunset')
-		sunset.set_text(self.weather['astronomy']['sunset'])
+		sunset.set_text(weather['astronomy']['sunset'])
+
+		for field in ('temp', 'pressure'):
+			ui.get_object('%s_trend' % field).queue_draw()
+
+	def on_trend_expose(self, area, event, field):
+		"""Draws the sparkline of field for current location.
+		"""
+
+		if self.current is None:
+			return False
+
+		values = self.get_trends(self.current).rings[field].values()
+		(width, height) = area.window.get_size()
+		points = oraje.sparkline(values, width, height)
+		if not len(points):
+			return False
+
+		cr = area.window.cairo_create()
+		cr.set_source_color(area.get_style().fg[gtk.STATE_NORMAL])
+		cr.set_line_width(1)
+		cr.move_to(*points[0])
+		for (x, y) in points[1:]:
+			cr.line_to(x, y)
+		cr.stroke()
+
+		return False
 
 	def on_details(self, component, verb):
 		"""Details dialog.
 		"""
 
-		if self.details:
+		if self.details is not None:
 			return
-		self.details = True
 
 		logging.debug('Menu on_details')
 		ui = gtk.Builder()
 		ui.set_translation_domain(self.PACKAGE)
 		ui.add_from_file('%s/share/OrajeApplet/details.ui' % sys.prefix)
 		dialog = ui.get_object('Details')
+		self.details = dialog
 		dialog.set_title('%s %s' % (self.PACKAGE, _('Details')))
 
+		for field in ('temp', 'pressure'):
+			area = ui.get_object('%s_trend' % field)
+			area.connect('expose-event', self.on_trend_expose, field)
+
 		self._set_details(ui)
 
 		update = ui.get_object('update')
@@ -893,13 +1401,19 @@ class OrajeApplet(gnomeapplet.Applet):
 		"""
 		logging.debug('on_details_update')
 		if self.connection:
-			if self.timeout is not None:
-				gobject.source_remove(self.timeout)
-				self.timeout = None
-			self.update_rss()
-			self.timeout = gobject.timeout_add(
-				int(self.conf['update'])*60*1000,
-				update_rss_callback, self)
+			self.update_rss(lambda: self._on_details_updated(ui, dialog))
+			self.schedule_update()
+		else:
+			self._on_details_updated(ui, dialog)
+
+	def _on_details_updated(self, ui, dialog):
+		"""Refresh the Details dialog once the update is done.
+
+		The dialog may have been closed (and maybe opened again) by the
+		time the update is done.
+		"""
+		if self.details is not dialog:
+			return
 		self._set_details(ui)
 		dialog.response(1)
 
@@ -921,7 +1435,7 @@ def update_rss_callback(data):
 	"""
 
 	logging.debug('Inside the callback')
-	data.update_rss()
+	data.update_rss(scheduled=True)
 	logging.debug('Leaving the callback, see you later')
 	return True
 
@@ -937,7 +1451,26 @@ OPTIONS:
 	-h, --help          This help screen
 	-v, --version       Show version and exit
 	-d, --debug         Enable debug output
+	    --stats         Collect metrics of the hot paths and write them to
+	                    stderr on SIGUSR1 and on exit
+	    --trace=SAMPLE  Write the spans of a SAMPLE fraction (0 to 1) of the
+	                    refreshes to the trace.log JSON lines file in the
+	                    XDG state directory
 	-w, --window        Launch in a standalone window for testing (debug=on)
+	-b, --batch=FILE    Fetch the weather of the WOEIDs in FILE (one per line,
+	                    - for stdin) and write it as JSON lines to stdout
+	-c, --concurrency=N Concurrent fetches in batch mode (default 8)
+	-r, --rate=N        Max fetches per second in batch mode (default 0,
+	                    no limit)
+	-s, --serve=[HOST:]PORT
+	                    Run a caching server for the WOEIDs in the
+	                    arguments (and any other requested), applets can
+	                    use it as 'api' http://HOST:PORT/weather?w=%%s&u=%%s
+	-t, --ttl=SECONDS   Time the server keeps the weather (default 900)
+	-a, --api=URL       Feeds URL in batch and server modes, with %%s for
+	                    the WOEID and the units (default Yahoo! Weather)
+	-H, --history=WOEID Write the daily stats of WOEID history as JSON
+	                    lines to stdout (requires numpy)
 
 This application uses Yahoo! Weather feeds and it's not endorsed or
 promoted by Yahoo! in any way.
@@ -949,16 +1482,27 @@ locale.textdomain(OrajeApplet.PACKAGE)
 
 if __name__ == '__main__':
 	gobject.type_register(OrajeApplet)
+	gobject.threads_init()
 
 	logging.getLogger().setLevel(logging.ERROR)
 
 	try:
-		(opts, args) = getopt(sys.argv[1:], 'hvdw', 
-			['help', 'version', 'debug', 'window'])
+		(opts, args) = getopt(sys.argv[1:], 'hvdwb:c:r:s:t:H:a:', 
+			['help', 'version', 'debug', 'window', 'batch=',
+			'concurrency=', 'rate=', 'serve=', 'ttl=', 'history=', 'stats',
+			'trace=', 'api='])
 	except Exception as e:
 		opts = []
 		args = sys.argv[1:]
 
+	batch = None
+	concurrency = 8
+	rate = 0
+	serve = None
+	ttl = 900
+	history = None
+	api = oraje.YAHOO_API
+
 	for op, ar in opts:
 		if op in ('-h', '--help'):
 			usage()
@@ -969,6 +1513,16 @@ if __name__ == '__main__':
 		elif op in ('-d', '--debug'):
 			logging.getLogger().setLevel(logging.DEBUG)
 			logging.debug('Running in debug mode')
+		elif op == '--stats':
+			metrics.enable()
+			# dump from the main loop, the signal may arrive while the
+			# main thread holds the registry lock
+			signal.signal(signal.SIGUSR1, lambda signum, frame:
+				gobject.idle_add(metrics.dump, sys.stderr))
+			atexit.register(metrics.dump, sys.stderr)
+		elif op == '--trace':
+			trace.configure(os.path.join(xdg.state_dir(), 'trace.log'),
+				float(ar))
 		elif op in ('-w', '--window'):
 			logging.getLogger().setLevel(logging.DEBUG)
 			logging.debug('Running in standalone window')
@@ -988,6 +1542,38 @@ if __name__ == '__main__':
 			app.show_all()
 			gtk.main()
 			exit(0)
+		elif op in ('-b', '--batch'):
+			batch = ar
+		elif op in ('-c', '--concurrency'):
+			concurrency = int(ar)
+		elif op in ('-r', '--rate'):
+			rate = float(ar)
+		elif op in ('-s', '--serve'):
+			serve = ar
+		elif op in ('-t', '--ttl'):
+			ttl = int(ar)
+		elif op in ('-H', '--history'):
+			history = ar
+		elif op in ('-a', '--api'):
+			api = ar
+
+	if batch is not None:
+		from oraje import batch as oraje_batch
+
+		exit(oraje_batch.main(['-c', str(concurrency), '-r', str(rate),
+			'-a', api, batch]))
+
+	if history is not None:
+		from oraje import stats
+
+		stats.report(oraje.History(os.path.join(xdg.data_dir(),
+			'history.db')), history, sys.stdout)
+		exit(0)
+
+	if serve is not None:
+		from oraje import server
+
+		exit(server.main(['-t', str(ttl), '-a', api, serve] + args))
 
 	gnomeapplet.bonobo_factory(
 		'OAFIID:Oraje_Applet_Factory',
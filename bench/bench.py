@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Oraje benchmarks.
+
+Runs the parse, render and lookup hot paths without a display or the
+network, and writes the results in JSON format so runs can be compared.
+
+Usage: bench.py [-o FILE] [-c BASELINE] [-r REPEAT] [BENCHMARK...]
+"""
+
+import sys
+import os
+import gc
+import glob
+import time
+import shutil
+import tempfile
+import platform
+from getopt import getopt
+from cStringIO import StringIO
+try:
+	import json
+except:
+	import simplejson as json
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import oraje
+import msgfmt
+
+FEEDS_DIR = os.path.join(BENCH_DIR, 'feeds')
+THEME_FILE = os.path.join(ROOT_DIR, 'theme.json')
+PO_DIR = os.path.join(ROOT_DIR, 'po')
+
+# every condition code, as set_status gets them from the feed
+CODES = [str(code) for code in range(oraje.Theme.SLOTS - 1)] + \
+	[str(oraje.Theme.NOT_AVAILABLE)]
+
+def bench_parse(tmp_dir):
+	"""rss_to_weather over the recorded feeds.
+	"""
+
+	feeds = [open(name).read()
+		for name in sorted(glob.glob(os.path.join(FEEDS_DIR, '*.xml')))]
+
+	def run():
+		for feed in feeds:
+			oraje.rss_to_weather(StringIO(feed))
+	return run
+
+
+def bench_wind(tmp_dir):
+	"""translate_wind over every angle, 0 to 360.
+	"""
+
+	angles = [str(angle) for angle in range(361)]
+
+	def run():
+		for angle in angles:
+			oraje.translate_wind(angle)
+	return run
+
+
+def bench_theme_lookup(tmp_dir):
+	"""Theme lookups done by set_status and status_str, every code.
+	"""
+
+	theme = oraje.Theme.compile(THEME_FILE)
+
+	def run():
+		for code in CODES:
+			if theme.has(code):
+				theme.status(code)
+				theme.desc(code)
+				theme.icon(code)
+	return run
+
+
+def bench_theme_compile(tmp_dir):
+	"""Theme.compile, loading a theme without a compiled version.
+	"""
+
+	def run():
+		oraje.Theme.compile(THEME_FILE)
+	return run
+
+
+def bench_theme_load(tmp_dir):
+	"""Theme.load, loading a theme from its compiled version.
+	"""
+
+	compiled_file = os.path.join(tmp_dir, 'theme.compiled')
+	oraje.Theme.load(THEME_FILE, compiled_file)
+
+	def run():
+		oraje.Theme.load(THEME_FILE, compiled_file)
+	return run
+
+
+def bench_msgfmt(tmp_dir):
+	"""msgfmt.make over the po/ catalogs.
+	"""
+
+	catalogs = [(name, os.path.join(tmp_dir, '%s.mo' %
+		os.path.basename(name)[:-3]))
+		for name in sorted(glob.glob(os.path.join(PO_DIR, '*.po')))]
+
+	def run():
+		for po_file, mo_file in catalogs:
+			msgfmt.make(po_file, mo_file)
+	return run
+
+
+BENCHMARKS = [
+	('parse', bench_parse),
+	('wind', bench_wind),
+	('theme_lookup', bench_theme_lookup),
+	('theme_compile', bench_theme_compile),
+	('theme_load', bench_theme_load),
+	('msgfmt', bench_msgfmt),
+]
+
+def calibrate(run, target=0.2):
+	"""Returns the number of calls that take about target seconds.
+	"""
+
+	number = 1
+	while True:
+		start = time.time()
+		for i in xrange(number):
+			run()
+		if time.time() - start >= target or number >= 1000000:
+			return number
+		number *= 2
+
+
+def objects(run):
+	"""Returns the objects tracked by the garbage collector in a call of
+	run: (peak, allocated, retained). The collector must be disabled.
+	"""
+
+	# the count of generation 0 goes up with every allocation and down
+	# with every deallocation, from 0 after a collection
+	peak = [0]
+	def profile(frame, event, arg):
+		peak[0] = max(peak[0], gc.get_count()[0])
+
+	gc.collect()
+	before = len(gc.get_objects())
+	sys.setprofile(profile)
+	try:
+		run()
+	finally:
+		sys.setprofile(None)
+	allocated = len(gc.get_objects()) - before
+	gc.collect()
+	retained = len(gc.get_objects()) - before
+
+	return (peak[0], allocated, retained)
+
+
+def measure(run, repeat):
+	"""Times run and measures its allocations.
+
+	Timings are taken with the garbage collector disabled, as timeit
+	does. Returns the seconds per call of every repetition and the
+	objects tracked by the garbage collector in a call: the peak of
+	objects alive during the call (sampled on every function call and
+	return), the ones still alive when it ends (garbage included) and
+	the ones retained after a collection.
+	"""
+
+	run()
+	number = calibrate(run)
+
+	timings = []
+	gc_enabled = gc.isenabled()
+	gc.disable()
+	try:
+		for i in range(repeat):
+			start = time.time()
+			for j in xrange(number):
+				run()
+			timings.append((time.time() - start)/number)
+
+		# minus the objects of an empty call
+		counts = [used - empty for used, empty in
+			zip(objects(run), objects(lambda: None))]
+	finally:
+		if gc_enabled:
+			gc.enable()
+
+	allocations = dict(zip(('peak_objects', 'allocated_objects',
+		'retained_objects'), counts))
+	return (number, timings, allocations)
+
+
+def compare(results, baseline):
+	"""Writes the change of the median timings against a baseline.
+	"""
+
+	old = baseline['benchmarks']
+	for name, result in sorted(results['benchmarks'].items()):
+		if name not in old:
+			continue
+		change = result['median']/old[name]['median'] - 1
+		print '%-16s %+7.1f%%%s' % (name, change*100,
+			abs(change) > 0.1 and '  <--' or '')
+
+
+def usage():
+	print __doc__
+	print 'Benchmarks: %s' % ', '.join(name for name, fn in BENCHMARKS)
+
+
+if __name__ == '__main__':
+	(opts, args) = getopt(sys.argv[1:], 'ho:c:r:',
+		['help', 'output=', 'compare=', 'repeat='])
+
+	output = None
+	baseline = None
+	repeat = 7
+
+	for op, ar in opts:
+		if op in ('-h', '--help'):
+			usage()
+			exit(0)
+		elif op in ('-o', '--output'):
+			output = ar
+		elif op in ('-c', '--compare'):
+			baseline = json.load(open(ar))
+		elif op in ('-r', '--repeat'):
+			repeat = int(ar)
+
+	results = dict(time=time.time(), python=platform.python_version(),
+		platform=platform.platform(), benchmarks=dict())
+
+	tmp_dir = tempfile.mkdtemp(prefix='oraje-bench-')
+	try:
+		for name, setup in BENCHMARKS:
+			if args and name not in args:
+				continue
+
+			(number, timings, allocations) = measure(setup(tmp_dir), repeat)
+			timings.sort()
+			result = dict(number=number, min=timings[0],
+				median=timings[len(timings)//2], timings=timings)
+			result.update(allocations)
+			results['benchmarks'][name] = result
+
+			print '%-16s %10.1fus  (min %.1fus, %d x %d) %s' % (name,
+				result['median']*1e6, result['min']*1e6, repeat, number,
+				', '.join('%s=%s' % item for item in sorted(allocations.items())))
+	finally:
+		shutil.rmtree(tmp_dir, True)
+
+	if output:
+		output_fd = open(output, 'w')
+		json.dump(results, output_fd, indent=1, sort_keys=True)
+		output_fd.close()
+
+	if baseline:
+		compare(results, baseline)
+
+# EOF
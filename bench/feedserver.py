@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Local stand-in for the Yahoo! Weather feeds server.
+
+Replays the recorded feeds in bench/feeds for load, replay and soak
+testing, with faults injected on a schedule. Point the applet's 'api'
+option (or --api in batch and server modes) to it:
+
+	http://127.0.0.1:8000/forecastrss?w=%s&u=%s
+
+Usage: feedserver.py [-p PORT] [-d DIR] [-R SECONDS] [-f FAULT]...
+
+Recordings are named WOEID.xml, or WOEID-N.xml to have several of the
+same location; with -R the next one is served every SECONDS.
+
+A fault is KIND[:ARG]@EVERY, applied to every EVERY-th request:
+
+	latency:SECONDS  answer after SECONDS
+	stall:SECONDS    send half of the answer and wait SECONDS (default 60)
+	reset            reset the connection without answering
+	error:CODE       answer with HTTP error CODE (default 503)
+"""
+
+import sys
+import os
+import re
+import glob
+import time
+import socket
+import struct
+import hashlib
+import logging
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from email.utils import formatdate
+from getopt import getopt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FEEDS_DIR = os.path.join(BENCH_DIR, 'feeds')
+
+class Recordings(object):
+	"""Recorded feeds per WOEID.
+
+	Each one is served with its validators (ETag and Last-Modified). With
+	rotate the next recording of a location is served every rotate
+	seconds of clock.
+	"""
+
+	def __init__(self, feeds_dir=FEEDS_DIR, rotate=0, clock=time.time):
+		self.rotate = rotate
+		self.clock = clock
+		self.start = clock()
+		self.feeds = dict()
+
+		for name in sorted(glob.glob(os.path.join(feeds_dir, '*.xml'))):
+			match = re.match(r'^(\d+)(-\d+)?\.xml$', os.path.basename(name))
+			if not match:
+				continue
+
+			feed_fd = open(name, 'r')
+			body = feed_fd.read()
+			feed_fd.close()
+
+			self.feeds.setdefault(match.group(1), []).append((body,
+				'"%s"' % hashlib.md5(body).hexdigest(),
+				formatdate(os.stat(name).st_mtime, usegmt=True)))
+
+	def get(self, woeid):
+		"""Returns (body, etag, last_modified) for woeid, or None.
+		"""
+
+		recordings = self.feeds.get(woeid)
+		if not recordings:
+			return None
+
+		index = 0
+		if self.rotate:
+			index = int((self.clock() - self.start)/self.rotate)
+		return recordings[index % len(recordings)]
+
+
+class Fault(object):
+	"""A fault injected every every-th request.
+	"""
+
+	KINDS = dict(latency=0, stall=60, reset=0, error=503)
+
+	def __init__(self, spec):
+		match = re.match(r'^(\w+)(?::([\d.]+))?@(\d+)$', spec)
+		if not match or match.group(1) not in self.KINDS:
+			raise ValueError('invalid fault %s' % spec)
+
+		self.kind = match.group(1)
+		self.arg = float(match.group(2) or self.KINDS[self.kind])
+		self.every = int(match.group(3))
+
+	def __str__(self):
+		return '%s:%g@%d' % (self.kind, self.arg, self.every)
+
+
+class FeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""Serves the recordings as Yahoo! Weather does.
+
+	GET /forecastrss?w=WOEID&u=UNITS, supporting conditional requests.
+	The units are ignored, feeds are served as recorded.
+	"""
+
+	protocol_version = 'HTTP/1.1'
+	# buffered, so the headers don't go in small packets
+	wbufsize = -1
+
+	def do_GET(self):
+		(path, sep, query) = self.path.partition('?')
+		if path != '/forecastrss':
+			return self._reply(404)
+
+		stall = 0
+		fault = self.server.fault()
+		if fault is not None:
+			if fault.kind == 'reset':
+				return self._reset()
+			if fault.kind == 'error':
+				return self._reply(int(fault.arg))
+			if fault.kind == 'latency':
+				time.sleep(fault.arg)
+			if fault.kind == 'stall':
+				stall = fault.arg
+
+		w = urlparse.parse_qs(query).get('w', [''])[0]
+		recording = self.server.recordings.get(w)
+		if recording is None:
+			return self._reply(404)
+
+		(body, etag, last_modified) = recording
+		headers = dict(ETag=etag)
+		headers['Last-Modified'] = last_modified
+
+		if self.headers.getheader('If-None-Match') is not None:
+			not_modified = self.headers.getheader('If-None-Match') == etag
+		else:
+			not_modified = \
+				self.headers.getheader('If-Modified-Since') == last_modified
+		if not_modified:
+			self.server.count('not_modified')
+			return self._reply(304, headers, stall=stall)
+
+		headers['Content-Type'] = 'text/xml;charset=UTF-8'
+		self._reply(200, headers, body, stall)
+
+	def _reply(self, code, headers=dict(), body='', stall=0):
+		"""Sends the answer, stalling half way for stall seconds.
+		"""
+
+		self.server.count(code)
+		self.send_response(code)
+		for header, value in headers.items():
+			self.send_header(header, value)
+		self.send_header('Content-Length', str(len(body)))
+
+		if not stall:
+			self.end_headers()
+			self.wfile.write(body)
+		elif body:
+			self.end_headers()
+			self.wfile.write(body[:len(body)//2])
+			self.wfile.flush()
+			time.sleep(stall)
+			self.wfile.write(body[len(body)//2:])
+		else:
+			self.wfile.flush()
+			time.sleep(stall)
+			self.end_headers()
+
+	def _reset(self):
+		"""Resets the connection (RST), closing it without lingering.
+		"""
+
+		self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+			struct.pack('ii', 1, 0))
+		self.rfile.close()
+		self.wfile.close()
+		self.connection.close()
+		self.close_connection = 1
+
+	def log_message(self, format, *args):
+		logging.debug('%s %s' % (self.client_address[0], format % args))
+
+
+class FeedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	"""Threaded HTTP server for the recordings.
+
+	Requests are counted in stats, by status code, 'not_modified' and
+	fault kind.
+	"""
+
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address, recordings, faults=[]):
+		BaseHTTPServer.HTTPServer.__init__(self, address, FeedHandler)
+		self.recordings = recordings
+		self.faults = list(faults)
+		self.requests = 0
+		self.stats = dict()
+		self.lock = threading.Lock()
+
+	def count(self, name):
+		with self.lock:
+			self.stats[name] = self.stats.get(name, 0) + 1
+
+	def fault(self):
+		"""Returns the fault of the next request, if any.
+		"""
+
+		with self.lock:
+			self.requests += 1
+			requests = self.requests
+
+		for fault in self.faults:
+			if requests % fault.every == 0:
+				self.count(fault.kind)
+				return fault
+		return None
+
+	def api(self):
+		"""Returns the API URL of the server, for Fetcher.
+		"""
+
+		return 'http://%s:%d/forecastrss?w=%%s&u=%%s' % self.server_address
+
+
+def start(address=('127.0.0.1', 0), recordings=None, faults=[]):
+	"""Starts a server in a background thread, returns it.
+
+	Stop it calling shutdown() and server_close().
+	"""
+
+	if recordings is None:
+		recordings = Recordings()
+
+	server = FeedServer(address, recordings, faults)
+	thread = threading.Thread(target=server.serve_forever, name='FeedServer')
+	thread.daemon = True
+	thread.start()
+
+	return server
+
+
+if __name__ == '__main__':
+	(opts, args) = getopt(sys.argv[1:], 'hvp:d:R:f:',
+		['help', 'verbose', 'port=', 'feeds=', 'rotate=', 'fault='])
+
+	port = 8000
+	feeds_dir = FEEDS_DIR
+	rotate = 0
+	faults = []
+
+	logging.getLogger().setLevel(logging.INFO)
+
+	for op, ar in opts:
+		if op in ('-h', '--help'):
+			print __doc__
+			exit(0)
+		elif op in ('-v', '--verbose'):
+			logging.getLogger().setLevel(logging.DEBUG)
+		elif op in ('-p', '--port'):
+			port = int(ar)
+		elif op in ('-d', '--feeds'):
+			feeds_dir = ar
+		elif op in ('-R', '--rotate'):
+			rotate = float(ar)
+		elif op in ('-f', '--fault'):
+			faults.append(Fault(ar))
+
+	recordings = Recordings(feeds_dir, rotate)
+	server = FeedServer(('127.0.0.1', port), recordings, faults)
+	logging.info('Serving %d locations on %s, faults: %s' % (
+		len(recordings.feeds), server.api(),
+		', '.join(str(fault) for fault in faults) or 'none'))
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+	logging.info('Requests: %s' % server.stats)
+
+# EOF
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Long-run soak test with memory growth tracking.
+
+Drives the applet's refresh cycle (fetch, parse, feed cache, scheduler,
+circuit breaker, history, trends, unit conversion, theme lookups and the
+weather snapshot) against the local feed server, with an accelerated
+clock: a month of refreshes runs in minutes. GTK and D-Bus are not
+needed, so pixbufs and notifications are not covered.
+
+Usage: soak.py [-D DAYS] [-i MINUTES] [-n SAMPLES] [-f FAULT]... [-o FILE]
+
+It reports memory (traced with tracemalloc when available, and RSS),
+objects tracked by the garbage collector, file descriptors and sockets
+every few cycles, the growth per cycle, and the object types retained.
+"""
+
+import sys
+import os
+import gc
+import time
+import shutil
+import logging
+import tempfile
+import Queue
+from getopt import getopt
+try:
+	import json
+except:
+	import simplejson as json
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import oraje
+import feedserver
+
+THEME_FILE = os.path.join(ROOT_DIR, 'theme.json')
+
+class Clock(object):
+	"""Accelerated clock, it only moves when advanced.
+	"""
+
+	def __init__(self, now=None):
+		self.now = now or time.time()
+
+	def __call__(self):
+		return self.now
+
+	def advance(self, seconds):
+		self.now += seconds
+
+
+class MainLoop(object):
+	"""Stand-in for the gobject main loop.
+
+	idle_add queues the calls, that run in the thread calling run().
+	"""
+
+	def __init__(self):
+		self.calls = Queue.Queue()
+
+	def idle_add(self, callback, *args):
+		self.calls.put((callback, args))
+
+	def run(self, done, timeout=60):
+		"""Runs queued calls until done() is True.
+		"""
+
+		while not done():
+			(callback, args) = self.calls.get(timeout=timeout)
+			callback(*args)
+
+
+class Refresher(object):
+	"""The applet's refresh cycle, without the UI.
+	"""
+
+	def __init__(self, woeids, api, work_dir, clock, workers=4):
+		self.woeids = woeids
+		self.work_dir = work_dir
+
+		cache = oraje.FeedCache(os.path.join(work_dir, 'feeds.json'))
+		self.fetcher = oraje.Fetcher(cache, api, timeout=5, connect_timeout=2)
+		self.loop = MainLoop()
+		self.pool = oraje.FetchPool(workers, self.loop.idle_add)
+		# the clock is accelerated, so nothing is fresh
+		self.coordinator = oraje.FetchCoordinator(self.fetcher.fetch,
+			self.pool, 0)
+		self.scheduler = oraje.PollScheduler(15, 5, 60, clock=clock)
+		self.breaker = oraje.CircuitBreaker(clock=clock)
+		self.history = oraje.History(os.path.join(work_dir, 'history.db'))
+		self.theme = oraje.Theme.load(THEME_FILE,
+			os.path.join(work_dir, 'theme.compiled'))
+		self.trends = dict()
+		self.weathers = dict()
+
+		self.stats = dict(cycles=0, skipped=0, failed=0, updated=0)
+
+	def cycle(self):
+		"""Runs a refresh, returns the seconds until the next one.
+		"""
+
+		self.stats['cycles'] += 1
+		if not self.breaker.allow():
+			self.stats['skipped'] += 1
+			return self.breaker.delay()
+
+		results = dict()
+		self.coordinator.request_many(
+			[(w, oraje.CANONICAL_UNITS) for w in self.woeids], results.update)
+		self.loop.run(lambda: results)
+
+		updated = dict((w, weather) for (w, c), weather in results.items()
+			if weather is not None)
+		if not updated:
+			self.stats['failed'] += 1
+			self.breaker.failure()
+			return self.breaker.delay()
+
+		self.breaker.success()
+		self.stats['updated'] += len(updated)
+		self.weathers.update(updated)
+
+		for w, weather in updated.items():
+			self.history.append(w, weather)
+			self.trends.setdefault(w, oraje.Trends()).append(weather)
+
+			# what set_status and the Details dialog do
+			weather = oraje.convert_units(weather, 'f')
+			code = weather['condition']['code']
+			if self.theme.has(code):
+				self.theme.status(code)
+				self.theme.desc(code)
+				self.theme.icon(code)
+			oraje.translate_wind(weather['wind']['direction'])
+
+		if self.woeids[0] in updated:
+			self.scheduler.update(updated[self.woeids[0]])
+		self.save_snapshot()
+
+		return self.scheduler.interval*60
+
+	def save_snapshot(self):
+		snapshot_file = os.path.join(self.work_dir, 'weather.json')
+		snapshot_fd = open('%s.tmp' % snapshot_file, 'w')
+		json.dump(dict(saved=time.time(), weathers=self.weathers), snapshot_fd)
+		snapshot_fd.close()
+		os.rename('%s.tmp' % snapshot_file, snapshot_file)
+
+	def close(self):
+		self.history.close()
+
+
+def rss():
+	"""Returns the resident set size in bytes.
+	"""
+
+	try:
+		statm_fd = open('/proc/self/statm', 'r')
+		pages = int(statm_fd.read().split()[1])
+		statm_fd.close()
+		return pages*os.sysconf('SC_PAGE_SIZE')
+	except (IOError, OSError):
+		import resource
+		# peak, in KB on Linux
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+
+def descriptors():
+	"""Returns the number of open file descriptors and sockets.
+	"""
+
+	try:
+		fds = os.listdir('/proc/self/fd')
+	except OSError:
+		return (None, None)
+
+	sockets = 0
+	for fd in fds:
+		try:
+			if os.readlink('/proc/self/fd/%s' % fd).startswith('socket:'):
+				sockets += 1
+		except OSError:
+			pass
+	return (len(fds), sockets)
+
+
+def object_types():
+	"""Returns the number of objects tracked by gc, by type name.
+	"""
+
+	types = dict()
+	for obj in gc.get_objects():
+		name = type(obj).__name__
+		types[name] = types.get(name, 0) + 1
+	return types
+
+
+def sample(cycle, clock, start):
+	gc.collect()
+	(fds, sockets) = descriptors()
+	result = dict(cycle=cycle, days=(clock() - start)/86400.0, rss=rss(),
+		objects=len(gc.get_objects()), fds=fds, sockets=sockets)
+	if tracemalloc is not None:
+		result['traced'] = tracemalloc.get_traced_memory()[0]
+	return result
+
+
+def slope(samples, key):
+	"""Returns the growth of key per cycle (least squares).
+	"""
+
+	points = [(s['cycle'], s[key]) for s in samples if s.get(key) is not None]
+	if len(points) < 2:
+		return None
+
+	n = float(len(points))
+	mx = sum(x for x, y in points)/n
+	my = sum(y for x, y in points)/n
+	sxx = sum((x - mx)**2 for x, y in points)
+	if not sxx:
+		return None
+	return sum((x - mx)*(y - my) for x, y in points)/sxx
+
+
+if __name__ == '__main__':
+	(opts, args) = getopt(sys.argv[1:], 'hvD:i:n:f:o:',
+		['help', 'verbose', 'days=', 'interval=', 'samples=', 'fault=',
+		'output='])
+
+	days = 30
+	interval = 15
+	samples = 20
+	faults = []
+	output = None
+
+	logging.getLogger().setLevel(logging.CRITICAL)
+
+	for op, ar in opts:
+		if op in ('-h', '--help'):
+			print __doc__
+			exit(0)
+		elif op in ('-v', '--verbose'):
+			logging.getLogger().setLevel(logging.WARNING)
+		elif op in ('-D', '--days'):
+			days = float(ar)
+		elif op in ('-i', '--interval'):
+			interval = int(ar)
+		elif op in ('-n', '--samples'):
+			samples = int(ar)
+		elif op in ('-f', '--fault'):
+			faults.append(feedserver.Fault(ar))
+		elif op in ('-o', '--output'):
+			output = ar
+
+	clock = Clock()
+	start = clock()
+
+	# every location cycles through all the recordings, so conditions
+	# change and both 200 and 304 answers are served
+	recordings = feedserver.Recordings(rotate=3*3600, clock=clock)
+	corpus = sum(recordings.feeds.values(), [])
+	woeids = sorted(recordings.feeds.keys())
+	for i, woeid in enumerate(woeids):
+		recordings.feeds[woeid] = corpus[i:] + corpus[:i]
+
+	server = feedserver.start(recordings=recordings, faults=faults)
+	work_dir = tempfile.mkdtemp(prefix='oraje-soak-')
+	refresher = Refresher(woeids, server.api(), work_dir, clock)
+	refresher.scheduler.set_base(interval)
+
+	# sampled evenly in simulated time
+	every = days*86400/samples
+
+	if tracemalloc is not None:
+		tracemalloc.start()
+
+	results = []
+	baseline = None
+	cycle = 0
+	wall = time.time()
+	try:
+		while clock() - start < days*86400:
+			clock.advance(refresher.cycle())
+			cycle += 1
+
+			if clock() - start < (len(results) + 1)*every:
+				continue
+
+			result = sample(cycle, clock, start)
+			results.append(result)
+			if baseline is None:
+				# after a warm up, caches and connections are in place
+				baseline = (result, object_types(),
+					tracemalloc and tracemalloc.take_snapshot())
+
+			print '%6d cycles %5.1f days  rss %6dKB  objects %7d  fds %3s  ' \
+				'sockets %3s%s' % (cycle, result['days'], result['rss']//1024,
+				result['objects'], result['fds'], result['sockets'],
+				'traced' in result and '  traced %dKB' %
+				(result['traced']//1024) or '')
+	finally:
+		server.shutdown()
+		server.server_close()
+		refresher.close()
+		shutil.rmtree(work_dir, True)
+
+	report = dict(days=days, interval=interval, cycles=cycle,
+		seconds=time.time() - wall, refresher=refresher.stats,
+		server=dict((str(k), v) for k, v in server.stats.items()),
+		fetcher=refresher.fetcher.stats, samples=results, growth=dict(),
+		retained=dict(), leaked=dict())
+
+	print '\n%d cycles (%s) in %.1fs, server %s' % (cycle,
+		refresher.stats, report['seconds'], report['server'])
+
+	print '\nGrowth per cycle:'
+	measured = results[results.index(baseline[0]):]
+	for key, unit in (('rss', 'bytes'), ('traced', 'bytes'),
+		('objects', ''), ('fds', ''), ('sockets', '')):
+		growth = slope(measured, key)
+		if growth is not None:
+			report['growth'][key] = growth
+			print ('  %-8s %+.2f %s' % (key, growth, unit)).rstrip()
+
+	last = results[-1]
+	for key in ('fds', 'sockets'):
+		if last[key] is not None and last[key] > baseline[0][key]:
+			report['leaked'][key] = last[key] - baseline[0][key]
+	if report['leaked']:
+		print '\nLeaked: %s' % report['leaked']
+
+	types = object_types()
+	retained = sorted(((count - baseline[1].get(name, 0), name)
+		for name, count in types.items()), reverse=True)[:10]
+	print '\nRetained object types:'
+	for count, name in retained:
+		if count > 0:
+			report['retained'][name] = count
+			print '  %-24s %+d' % (name, count)
+
+	if tracemalloc is not None:
+		print '\nTop allocation growth:'
+		top = tracemalloc.take_snapshot().compare_to(baseline[2], 'lineno')
+		report['allocations'] = [str(stat) for stat in top[:10]]
+		for stat in top[:10]:
+			print '  %s' % stat
+
+	if output:
+		output_fd = open(output, 'w')
+		json.dump(report, output_fd, indent=1, sort_keys=True)
+		output_fd.close()
+
+# EOF
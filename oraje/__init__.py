@@ -0,0 +1,36 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Oraje core library.
+
+Fetching, parsing and unit conversion of Yahoo! Weather feeds. It doesn't
+depend on GTK, so it can be used without a display (ie. from batch jobs
+or servers). OrajeApplet is a view on top of it.
+"""
+
+from oraje.feed import rss_to_weather, translate_wind
+from oraje.units import CANONICAL_UNITS, UNITS, convert_units
+from oraje.fetch import YAHOO_API, FeedCache, Fetcher, FetchPool, \
+	FetchCoordinator
+from oraje.schedule import PollScheduler, CircuitBreaker
+from oraje.theme import Theme
+from oraje.history import History
+from oraje.trend import Trends, sparkline
+
+# EOF
@@ -0,0 +1,214 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Batch mode: fetch the weather of many locations as JSON lines.
+
+It doesn't need GTK, run it with python -m oraje.batch:
+
+Usage: python -m oraje.batch [OPTIONS] [FILE]
+
+OPTIONS:
+	-h, --help          This help screen
+	-d, --debug         Enable debug output
+	-c, --concurrency=N Concurrent fetches (default 8)
+	-r, --rate=N        Max fetches per second (default 0, no limit)
+	-u, --units=UNITS   Units, c or f (default c)
+	-a, --api=URL       Feeds URL, with %s for the WOEID and the units
+
+FILE has a WOEID per line (default - for stdin), the weather is written
+to stdout. The exit status is 1 if any fetch failed.
+"""
+
+import sys
+import logging
+import threading
+import time
+import Queue
+try:
+	import json
+except:
+	import simplejson as json
+
+from getopt import getopt
+
+from oraje.fetch import YAHOO_API, Fetcher
+from oraje.units import CANONICAL_UNITS
+
+class RateLimiter(object):
+	"""Limits the rate of calls to wait() to rate per second.
+
+	It can be shared between threads. A rate of 0 means no limit.
+	"""
+
+	def __init__(self, rate, clock=time.time, sleep=time.sleep):
+		self.rate = rate
+		self.clock = clock
+		self.sleep = sleep
+
+		self.next = 0
+		self.lock = threading.Lock()
+
+	def wait(self):
+		"""Blocks until the next call is allowed.
+		"""
+
+		if not self.rate:
+			return
+
+		with self.lock:
+			now = self.clock()
+			slot = max(now, self.next)
+			self.next = slot + 1.0/self.rate
+
+		if slot > now:
+			self.sleep(slot - now)
+
+
+def read_woeids(stream):
+	"""Yields the WOEIDs in stream, one per line.
+
+	Empty lines and lines starting with # are ignored.
+	"""
+
+	for line in stream:
+		line = line.strip()
+		if line and not line.startswith('#'):
+			yield line
+
+
+def run(woeids, output, concurrency=8, rate=0, units=CANONICAL_UNITS,
+	fetcher=None):
+	"""Fetches the weather of woeids and writes it to output.
+
+	woeids can be any iterable, and it's consumed lazily. Up to
+	concurrency fetches run at the same time, limited to rate fetches
+	per second (if not 0). A JSON object is written per line as soon as
+	each fetch finishes, so the order isn't preserved:
+
+	{"woeid": "32997", "weather": {...}}
+	{"woeid": "0", "error": "fetch failed"}
+
+	Only a few WOEIDs are queued at any time, so memory use doesn't
+	depend on the number of WOEIDs. Returns (fetched, failed).
+	"""
+
+	if fetcher is None:
+		fetcher = Fetcher()
+
+	limiter = RateLimiter(rate)
+	jobs = Queue.Queue(concurrency*2)
+	results = Queue.Queue(concurrency*2)
+
+	def feed():
+		try:
+			for woeid in woeids:
+				jobs.put(woeid)
+		except Exception as e:
+			logging.error('Error reading the WOEIDs: %s' % e)
+		for i in range(concurrency):
+			jobs.put(None)
+
+	def work():
+		while True:
+			woeid = jobs.get()
+			if woeid is None:
+				break
+
+			limiter.wait()
+			try:
+				weather = fetcher.fetch(woeid, units)
+			except Exception as e:
+				logging.error('Failed to fetch %s: %s' % (woeid, e))
+				weather = None
+
+			if weather is None:
+				results.put(dict(woeid=woeid, error='fetch failed'))
+			else:
+				results.put(dict(woeid=woeid, weather=weather))
+		results.put(None)
+
+	threads = [threading.Thread(target=feed, name='BatchFeeder')]
+	for i in range(concurrency):
+		threads.append(threading.Thread(target=work,
+			name='BatchWorker-%d' % i))
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+
+	fetched = failed = 0
+	running = concurrency
+	while running:
+		result = results.get()
+		if result is None:
+			running -= 1
+			continue
+
+		if 'error' in result:
+			failed += 1
+		else:
+			fetched += 1
+		output.write('%s\n' % json.dumps(result))
+		output.flush()
+
+	logging.debug('Batch done, %d fetched, %d failed' % (fetched, failed))
+	return (fetched, failed)
+
+
+def main(argv):
+	"""Command line entry point, returns the exit status.
+	"""
+
+	(opts, args) = getopt(argv, 'hdc:r:u:a:', ['help', 'debug',
+		'concurrency=', 'rate=', 'units=', 'api='])
+
+	concurrency = 8
+	rate = 0
+	units = CANONICAL_UNITS
+	api = YAHOO_API
+
+	for op, ar in opts:
+		if op in ('-h', '--help'):
+			print __doc__
+			return 0
+		elif op in ('-d', '--debug'):
+			logging.getLogger().setLevel(logging.DEBUG)
+		elif op in ('-c', '--concurrency'):
+			concurrency = int(ar)
+		elif op in ('-r', '--rate'):
+			rate = float(ar)
+		elif op in ('-u', '--units'):
+			units = ar
+		elif op in ('-a', '--api'):
+			api = ar
+
+	if not args or args[0] == '-':
+		stream = sys.stdin
+	else:
+		stream = open(args[0], 'r')
+
+	(fetched, failed) = run(read_woeids(stream), sys.stdout, concurrency,
+		rate, units, Fetcher(api=api))
+	return failed and 1 or 0
+
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.ERROR)
+	sys.exit(main(sys.argv[1:]))
+
+# EOF
@@ -0,0 +1,146 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Yahoo! Weather RSS parsing.
+"""
+
+import gettext
+from xml.parsers import expat
+
+_ = gettext.translation('OrajeApplet', fallback=True).ugettext
+
+YWEATHER_NS = 'http://xml.weather.yahoo.com/ns/rss/1.0'
+
+# yweather elements and the attributes used from each one
+TAGS = dict(
+	location = ['city', 'country'],
+	units = [ 'temperature', 'distance', 'pressure',
+		'speed' ],
+	wind = [ 'chill', 'direction', 'speed' ],
+	atmosphere = [ 'humidity', 'visibility', 'pressure'
+		,'rising'],
+	astronomy = [ 'sunrise', 'sunset'], 
+	condition = [ 'text', 'code', 'temp', 'date']
+)
+
+class ParseDone(Exception):
+	"""Raised from expat handlers to stop parsing early.
+	"""
+	pass
+
+
+def rss_to_weather(rss):
+	"""Translates from Yahoo! Weather RSS into Oraje weather dict.
+
+	The RSS is read from a file-like object and parsed as a stream,
+	no DOM is built. Only the first element of each yweather tag is
+	used, and the parsing stops as soon as all of them are found.
+
+	The TTL of the channel is included as channel/ttl.
+	"""
+
+	weather = dict()
+	channel = dict(ttl=u'')
+	text = []
+
+	def start_element(name, attrs):
+		if name == 'ttl':
+			text.append(u'')
+			return
+
+		(ns, sep, tag) = name.rpartition(' ')
+		if ns != YWEATHER_NS or tag not in TAGS or tag in weather:
+			return
+
+		node = dict()
+		for n in TAGS[tag]:
+			node[n] = attrs.get(n, u'')
+		weather[tag] = node
+
+		if len(weather) == len(TAGS):
+			raise ParseDone()
+
+	def character_data(data):
+		if text:
+			text.append(data)
+
+	def end_element(name):
+		if name == 'ttl' and text:
+			channel['ttl'] = u''.join(text).strip()
+			del text[:]
+
+	parser = expat.ParserCreate(namespace_separator=' ')
+	parser.StartElementHandler = start_element
+	parser.CharacterDataHandler = character_data
+	parser.EndElementHandler = end_element
+
+	try:
+		while True:
+			chunk = rss.read(4096)
+			parser.Parse(chunk, not chunk)
+			if not chunk:
+				break
+	except ParseDone:
+		pass
+
+	missing = [t for t in TAGS if t not in weather]
+	if missing:
+		raise ValueError('yweather elements not found: %s' %
+			', '.join(missing))
+
+	weather['channel'] = channel
+	return weather
+
+
+def translate_wind(angle):
+	"""Translates wind direction in degrees into a compass point.
+	"""
+
+	table = [
+		[348.75, 371.25, _('N')],
+		[11.25, 33.75, _('NNE')],
+		[33.75, 56.25, _('NE')],
+		[56.25, 78.75, _('ENE')],
+		[78.75, 101.25, _('E')],
+		[101.25, 123.75, _('ESE')],
+		[123.75, 146.25, _('SE')],
+		[146.25, 168.75, _('SSE')],
+		[168.75, 191.25, _('S')],
+		[191.25, 213.75, _('SSW')],
+		[213.75, 236.25, _('SW')],
+		[236.25, 258.75, _('WSW')],
+		[258.75, 281.25, _('W')],
+		[281.25, 303.75, _('WNW')],
+		[303.75, 326.25, _('NW')],
+		[326.25, 348.75, _('NNW')]
+	]
+
+	angle = int(angle)
+
+	# North is a special [348.75, 11.25]
+	if angle <= 11.25:
+		angle += 360
+
+	for i in table:
+		if angle >= i[0] and angle < i[1]:
+			return i[2]
+
+	return '?'
+
+# EOF
@@ -0,0 +1,544 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Yahoo! Weather feeds fetching.
+"""
+
+import os
+import logging
+import threading
+import socket
+import time
+import base64
+import httplib
+import urllib
+import urlparse
+import Queue
+from cStringIO import StringIO
+try:
+	import json
+except:
+	import simplejson as json
+
+from oraje.feed import rss_to_weather
+from oraje import metrics
+from oraje import trace
+
+YAHOO_API = 'http://xml.weather.yahoo.com/forecastrss?w=%s&u=%s'
+
+class FeedCache(object):
+	"""HTTP cache for the RSS feeds.
+
+	It keeps the body and the validators sent by the server (ETag and
+	Last-Modified) keyed by (WOEID, units), so conditional requests
+	don't depend on the local clock. The cache is stored in JSON format
+	and can be shared between threads.
+	"""
+
+	def __init__(self, cache_file):
+		self.cache_file = cache_file
+		self.entries = dict()
+		self.lock = threading.Lock()
+
+	def load(self):
+		"""Loads the cache from disk, a missing cache is not an error.
+		"""
+
+		try:
+			cache_fd = open(self.cache_file, 'r')
+		except IOError:
+			logging.debug('No feed cache found in %s' % self.cache_file)
+			return
+
+		try:
+			entries = json.load(cache_fd)
+		except Exception as e:
+			logging.warning('Ignoring broken feed cache %s: %s' %
+				(self.cache_file, e))
+			entries = dict()
+		cache_fd.close()
+
+		for entry in entries.values():
+			entry['body'] = entry['body'].encode('utf-8')
+
+		with self.lock:
+			self.entries = entries
+		logging.debug('Feed cache loaded, %d entries' % len(entries))
+
+	def save(self):
+		"""Saves the cache to disk.
+
+		The file is replaced atomically so a crash can't leave a
+		truncated cache behind.
+		"""
+
+		tmp_file = '%s.tmp' % self.cache_file
+		with self.lock:
+			try:
+				cache_fd = open(tmp_file, 'w')
+				json.dump(self.entries, cache_fd)
+				cache_fd.close()
+				os.rename(tmp_file, self.cache_file)
+			except Exception as e:
+				logging.error('Failed to save %s: %s' % (self.cache_file, e))
+
+	def get(self, w, c):
+		"""Returns the cached entry for (w, c), if any.
+		"""
+
+		with self.lock:
+			return self.entries.get('%s/%s' % (w, c))
+
+	def validators(self, w, c):
+		"""Returns the headers needed for a conditional GET of (w, c).
+		"""
+
+		headers = dict()
+		entry = self.get(w, c)
+		if entry is not None:
+			if entry['etag']:
+				headers['If-None-Match'] = entry['etag']
+			if entry['last_modified']:
+				headers['If-Modified-Since'] = entry['last_modified']
+		return headers
+
+	def store(self, w, c, etag, last_modified, body):
+		"""Stores a new body and its validators for (w, c).
+		"""
+
+		with self.lock:
+			self.entries['%s/%s' % (w, c)] = dict(etag=etag,
+				last_modified=last_modified, body=body)
+
+
+class Fetcher(object):
+	"""Downloads and parses Yahoo! Weather feeds.
+
+	It can be shared between threads, each thread keeps its own
+	connections alive. Aborted downloads are counted in stats.
+	"""
+
+	# followed up to MAX_REDIRECTS times
+	REDIRECTS = (301, 302, 303, 307)
+	MAX_REDIRECTS = 5
+
+	def __init__(self, cache=None, api=YAHOO_API, timeout=30,
+		connect_timeout=10):
+		self.cache = cache
+		self.api = api
+		self.timeout = timeout
+		self.connect_timeout = connect_timeout
+
+		self.connections = threading.local()
+		self.stats = dict(fetches=0, aborted_connect=0,
+			aborted_first_byte=0, aborted_read=0)
+
+	def fetch(self, w, c):
+		"""Download and parse the RSS for (w, c).
+
+		The api can also point to an Oraje server (see oraje.server),
+		that provides the weather already parsed in JSON format.
+
+		Returns None on error.
+		"""
+
+		rss = self.get_rss(w, c)
+		if rss is None:
+			return None
+
+		try:
+			with metrics.timer('fetch.parse'), trace.span('parse'):
+				if rss.getvalue().lstrip()[:1] == '{':
+					weather = json.load(rss)
+				else:
+					weather = rss_to_weather(rss)
+		except Exception as e:
+			logging.error('Error parsing the RSS: %s' % e)
+			metrics.count('fetch.parse_errors')
+			weather = None
+
+		rss.close()
+		rss = None
+		return weather
+
+	def get_rss(self, w, c):
+		"""Download the RSS within the configured timeout budget.
+
+		Connecting is bounded by connect_timeout, and waiting for the
+		first byte and every read by what is left of the budget (timeout
+		seconds for the whole download, redirects included). The whole
+		body is read before returning it as a file-like object.
+
+		The request is conditional when the feed is in the cache, and
+		the cached body is returned if the server answers with a 304.
+
+		Proxies are taken from the environment (http_proxy, https_proxy
+		and no_proxy) and redirects are followed, as urllib2 does.
+		Connections are kept alive per worker thread and reused.
+		"""
+
+		budget = float(self.timeout)
+		start = time.time()
+
+		with trace.span('request') as span:
+			url = self.api % (w, c)
+			headers = dict()
+			if self.cache is not None:
+				headers = self.cache.validators(w, c)
+			span.set(server=urlparse.urlsplit(url)[1],
+				conditional=bool(headers))
+
+		self.stats['fetches'] += 1
+		metrics.count('fetch.requests')
+
+		for redirect in range(self.MAX_REDIRECTS + 1):
+			result = self._get(url, headers, start, budget)
+			if result is None:
+				return None
+
+			(response, body) = result
+			location = response.getheader('Location')
+			if response.status not in self.REDIRECTS or not location:
+				break
+
+			url = urlparse.urljoin(url, location)
+			logging.debug('RSS redirected (%d) to %s' % (response.status, url))
+		else:
+			logging.error('Too many redirects downloading the RSS')
+			metrics.count('fetch.errors')
+			return None
+
+		if response.status == 304 and self.cache is not None:
+			entry = self.cache.get(w, c)
+			if entry is not None:
+				metrics.count('fetch.not_modified')
+				logging.debug('RSS not modified, etag: %s, '
+					'last_modified: %s' % (entry['etag'],
+					entry['last_modified']))
+				return StringIO(entry['body'])
+			logging.error('RSS not modified but not in the cache')
+			metrics.count('fetch.errors')
+			return None
+		elif response.status != 200:
+			logging.error('HTTP Error downloading the RSS: %d %s' %
+				(response.status, response.reason))
+			metrics.count('fetch.errors')
+			return None
+
+		logging.debug('RSS downloaded in %.2fs' % (time.time() - start))
+
+		if self.cache is not None:
+			self.cache.store(w, c, response.getheader('ETag'),
+				response.getheader('Last-Modified'), body)
+			self.cache.save()
+
+		return StringIO(body)
+
+	def _get(self, url, headers, start, budget):
+		"""Sends a GET request for url and reads the answer.
+
+		Returns (response, body), or None on error.
+		"""
+
+		def remaining():
+			return max(0.001, budget - (time.time() - start))
+
+		(scheme, host, path, query, fragment) = urlparse.urlsplit(url)
+		if query:
+			path = '%s?%s' % (path, query)
+
+		headers = dict(headers)
+		proxy_headers = dict()
+		proxy = self._proxy(scheme, host)
+		if proxy is not None:
+			(proxy, authorization) = proxy
+			if authorization is not None:
+				proxy_headers['Proxy-Authorization'] = authorization
+			if scheme == 'http':
+				# https goes through a CONNECT tunnel instead
+				path = '%s://%s%s' % (scheme, host, path)
+				headers.update(proxy_headers)
+
+		key = (scheme, host, proxy)
+		try:
+			for attempt in (1, 2):
+				phase = 'connect'
+				conn = self._connection(key, proxy_headers)
+				reused = conn.sock is not None
+				try:
+					if not reused:
+						conn.timeout = min(float(self.connect_timeout),
+							remaining())
+						# name resolution included
+						with metrics.timer('fetch.connect'), \
+							trace.span('connect', proxy=proxy):
+							conn.connect()
+					phase = 'first_byte'
+					sent = time.time()
+					# httplib closes conn.sock when the server closes the
+					# connection, the response keeps reading from this one
+					sock = getattr(conn.sock, '_sock', conn.sock)
+					with trace.span('wait', reused=reused):
+						sock.settimeout(remaining())
+						conn.request('GET', path, headers=headers)
+						sock.settimeout(remaining())
+						response = conn.getresponse()
+					metrics.observe('fetch.first_byte', time.time() - sent)
+					break
+				except (httplib.HTTPException, socket.error) as error:
+					self._drop_connection(key)
+					# the server may have closed a kept alive connection
+					if not reused or isinstance(error, socket.timeout):
+						raise
+					logging.debug('Lost kept alive connection: %s' % error)
+
+			phase = 'read'
+			first_byte = time.time()
+			metrics.count('fetch.reused_connections', reused)
+			body = []
+			with trace.span('read', status=response.status) as span:
+				while True:
+					if time.time() - start > budget:
+						raise socket.timeout('timeout budget exhausted')
+					sock.settimeout(remaining())
+					chunk = response.read(8192)
+					if not chunk:
+						break
+					body.append(chunk)
+				span.set(size=sum(len(chunk) for chunk in body))
+
+			if response.will_close:
+				self._drop_connection(key)
+			metrics.observe('fetch.download', time.time() - first_byte)
+
+		except socket.timeout:
+			self._drop_connection(key)
+			self._fetch_aborted(phase, start)
+			return None
+		except (httplib.HTTPException, socket.error) as error:
+			self._drop_connection(key)
+			logging.error('Error downloading the RSS: %s' % error)
+			metrics.count('fetch.errors')
+			return None
+
+		return (response, ''.join(body))
+
+	def _proxy(self, scheme, host):
+		"""Returns the proxy for host as (host:port, authorization), or None.
+
+		The proxies are read from the environment, as urllib2 does.
+		"""
+
+		proxy = urllib.getproxies().get(scheme)
+		if not proxy or urllib.proxy_bypass(host.split(':')[0]):
+			return None
+
+		if not '://' in proxy:
+			proxy = 'http://%s' % proxy
+		proxy = urlparse.urlsplit(proxy)
+
+		authorization = None
+		if proxy.username is not None:
+			authorization = 'Basic %s' % base64.b64encode('%s:%s' % (
+				urllib.unquote(proxy.username),
+				urllib.unquote(proxy.password or '')))
+
+		return (proxy.hostname + (proxy.port and ':%d' % proxy.port or ''),
+			authorization)
+
+	def _connection(self, key, proxy_headers=dict()):
+		"""Returns the connection for key of the current thread.
+
+		key is (scheme, host, proxy), connections to https hosts through
+		a proxy are tunnelled sending proxy_headers.
+		"""
+
+		connections = self.connections.__dict__.setdefault('hosts', dict())
+		conn = connections.get(key)
+		if conn is None:
+			(scheme, host, proxy) = key
+			if scheme == 'https':
+				conn = httplib.HTTPSConnection(proxy or host)
+				if proxy is not None:
+					conn.set_tunnel(host, headers=proxy_headers)
+			else:
+				conn = httplib.HTTPConnection(proxy or host)
+			connections[key] = conn
+		return conn
+
+	def _drop_connection(self, key):
+		"""Closes the connection for key of the current thread.
+		"""
+
+		connections = self.connections.__dict__.get('hosts', dict())
+		conn = connections.pop(key, None)
+		if conn is not None:
+			conn.close()
+
+	def _fetch_aborted(self, phase, start):
+		"""Account for a fetch aborted because of a timeout.
+		"""
+
+		self.stats['aborted_%s' % phase] += 1
+		metrics.count('fetch.aborted_%s' % phase)
+		logging.warning('RSS download aborted after %.2fs waiting for %s, '
+			'budget is %ss: %s' % (time.time() - start, phase,
+			self.timeout, self.stats))
+
+
+class FetchPool(object):
+	"""Bounded pool of fetch worker threads.
+
+	Jobs run in up to size worker threads, started on demand and kept
+	alive so they can reuse their connections. The result of calling
+	fetch(*args) is handed back to callback using dispatch(callback,
+	result), ie. gobject.idle_add to call it from the main loop.
+	"""
+
+	def __init__(self, size=4, dispatch=None):
+		self.size = size
+		self.dispatch = dispatch or (lambda callback, result:
+			callback(result))
+		self.jobs = Queue.Queue()
+		self.workers = 0
+		self.idle = 0
+		self.lock = threading.Lock()
+
+	def submit(self, fetch, args, callback):
+		"""Queues a fetch, starting a new worker if needed.
+
+		A worker is started while there are more jobs waiting than idle
+		workers, up to size.
+		"""
+
+		self.jobs.put((fetch, args, callback))
+
+		# idle workers may already be taken by queued jobs
+		with self.lock:
+			start = self.jobs.qsize() > self.idle and \
+				self.workers < self.size
+			if start:
+				self.workers += 1
+
+		if start:
+			worker = threading.Thread(target=self._work,
+				name='FetchWorker-%d' % self.workers)
+			worker.daemon = True
+			worker.start()
+
+	def _work(self):
+		while True:
+			with self.lock:
+				self.idle += 1
+			(fetch, args, callback) = self.jobs.get()
+			with self.lock:
+				self.idle -= 1
+
+			try:
+				result = fetch(*args)
+			except Exception as e:
+				logging.error('Fetch worker failed: %s' % e)
+				result = None
+
+			self.dispatch(callback, result)
+
+
+class FetchCoordinator(object):
+	"""Single-flight fetches keyed by (WOEID, units).
+
+	A request for a key that is already being fetched waits for that
+	fetch instead of starting a new one, and a successful result is
+	reused for requests arriving up to fresh seconds after it finished.
+	Callbacks are always called using the dispatch function of the pool,
+	and the coordinator must be used from the same thread the callbacks
+	are dispatched to (ie. the main loop).
+	"""
+
+	def __init__(self, fetch, pool, fresh=60):
+		self.fetch = fetch
+		self.pool = pool
+		self.fresh = fresh
+		self.inflight = dict()
+		self.results = dict()
+
+	def request(self, w, c, callback, span=trace.NULL_SPAN):
+		"""Requests (w, c), callback will be called with the result.
+
+		The fetch is traced as a child of span, that is passed along
+		because it runs in a worker thread.
+		"""
+
+		key = (w, c)
+
+		if key in self.inflight:
+			logging.debug('Fetch of %s/%s in flight, reusing it' % key)
+			self.inflight[key].append(callback)
+			return
+
+		result = self.results.get(key)
+		if result is not None and time.time() - result[0] < self.fresh:
+			logging.debug('Fetch of %s/%s is fresh, reusing it' % key)
+			self.pool.dispatch(lambda weather: self._reuse(callback, weather),
+				result[1])
+			return
+
+		self.inflight[key] = [callback]
+		self.pool.submit(self._fetch, (w, c, span),
+			lambda weather: self._done(key, weather))
+
+	def request_many(self, keys, callback, span=trace.NULL_SPAN):
+		"""Requests several (w, c) at once.
+
+		callback will be called once, with a dict of results by key,
+		when all of them are done.
+		"""
+
+		keys = list(set(keys))
+		results = dict()
+
+		def done(key, weather):
+			results[key] = weather
+			if len(results) == len(keys):
+				callback(results)
+
+		for key in keys:
+			self.request(key[0], key[1],
+				lambda weather, key=key: done(key, weather), span)
+
+	def _fetch(self, w, c, span):
+		with span.child('fetch', woeid=w) as child:
+			weather = self.fetch(w, c)
+			child.set(ok=weather is not None)
+		return weather
+
+	def _reuse(self, callback, weather):
+		metrics.count('fetch.cache_hits')
+		callback(weather)
+		return False
+
+	def _done(self, key, weather):
+		if weather is not None:
+			self.results[key] = (time.time(), weather)
+
+		for callback in self.inflight.pop(key):
+			callback(weather)
+
+		return False
+
+# EOF
@@ -0,0 +1,131 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Historical weather observations.
+"""
+
+import logging
+import calendar
+import sqlite3
+
+from oraje.units import CANONICAL_UNITS, convert_units
+
+MONTHS = dict(Jan=1, Feb=2, Mar=3, Apr=4, May=5, Jun=6, Jul=7, Aug=8,
+	Sep=9, Oct=10, Nov=11, Dec=12)
+
+def observation_time(date):
+	"""Translates a condition date into seconds since the epoch.
+
+	Yahoo! Weather uses the location's local time (ie. 'Wed, 14 Dec 2011
+	6:50 pm GMT'), the time zone is ignored so the result is the local
+	time of the observation. It doesn't depend on the current locale.
+	"""
+
+	(day, month, year, clock, meridiem) = date.split()[1:6]
+	(hour, minute) = clock.split(':')
+
+	hour = int(hour) % 12
+	if meridiem.lower() == 'pm':
+		hour += 12
+
+	return calendar.timegm((int(year), MONTHS[month], int(day), hour,
+		int(minute), 0))
+
+
+class History(object):
+	"""Append-only store of weather observations.
+
+	Observations are stored in SQLite as numbers, in CANONICAL_UNITS,
+	with the location (WOEID) and the observation time as primary key.
+	Any observation with the same condition date than a stored one is
+	ignored, so polling more often than the feed changes doesn't grow
+	the store.
+	"""
+
+	# column: (node, field)
+	FIELDS = [
+		('temp', ('condition', 'temp')),
+		('chill', ('wind', 'chill')),
+		('wind_speed', ('wind', 'speed')),
+		('wind_direction', ('wind', 'direction')),
+		('humidity', ('atmosphere', 'humidity')),
+		('pressure', ('atmosphere', 'pressure')),
+		('visibility', ('atmosphere', 'visibility')),
+		('code', ('condition', 'code')),
+	]
+
+	COLUMNS = ['time'] + [column for column, field in FIELDS]
+
+	def __init__(self, db_file):
+		self.db = sqlite3.connect(db_file)
+		self.db.execute('CREATE TABLE IF NOT EXISTS observations ('
+			'woeid INTEGER NOT NULL, time INTEGER NOT NULL, '
+			'temp REAL, chill REAL, wind_speed REAL, wind_direction REAL, '
+			'humidity REAL, pressure REAL, visibility REAL, code INTEGER, '
+			'PRIMARY KEY (woeid, time))')
+		self.db.commit()
+
+	def close(self):
+		self.db.close()
+
+	def append(self, woeid, weather):
+		"""Appends an observation of woeid.
+
+		Returns True if it was stored, False if it was already there.
+		"""
+
+		weather = convert_units(weather, CANONICAL_UNITS)
+
+		row = [int(woeid), observation_time(weather['condition']['date'])]
+		for column, (node, field) in self.FIELDS:
+			try:
+				row.append(float(weather[node][field]))
+			except (KeyError, ValueError):
+				row.append(None)
+
+		cursor = self.db.execute('INSERT OR IGNORE INTO observations '
+			'VALUES (%s)' % ', '.join('?'*len(row)), row)
+		self.db.commit()
+
+		if cursor.rowcount:
+			logging.debug('Observation of %s at %d stored' % tuple(row[:2]))
+		return cursor.rowcount > 0
+
+	def range(self, woeid, start=0, end=2**62):
+		"""Returns the observations of woeid in [start, end).
+
+		Observations are returned as tuples of values in COLUMNS order,
+		sorted by time.
+		"""
+
+		return self.db.execute('SELECT %s FROM observations '
+			'WHERE woeid = ? AND time >= ? AND time < ? ORDER BY time' %
+			', '.join(self.COLUMNS), (int(woeid), start, end)).fetchall()
+
+	def last(self, woeid, count):
+		"""Returns the last count observations of woeid, sorted by time.
+		"""
+
+		rows = self.db.execute('SELECT %s FROM observations '
+			'WHERE woeid = ? ORDER BY time DESC LIMIT ?' %
+			', '.join(self.COLUMNS), (int(woeid), count)).fetchall()
+		rows.reverse()
+		return rows
+
+# EOF
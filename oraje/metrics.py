@@ -0,0 +1,211 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Counters and latency histograms for the hot paths.
+
+Metrics are disabled by default and recording them is then a single
+attribute check. The registry is global, like logging:
+
+	from oraje import metrics
+
+	metrics.count('fetch.not_modified')
+	with metrics.timer('parse'):
+		...
+
+	@metrics.timed('set_status')
+	def set_status(self, ...):
+		...
+"""
+
+import math
+import time
+import threading
+from functools import wraps
+
+# bucket i holds latencies in [2**(i-1), 2**i) microseconds
+BUCKETS = 32
+
+class Histogram(object):
+	"""Latency histogram with logarithmic buckets.
+	"""
+
+	def __init__(self):
+		self.buckets = [0]*BUCKETS
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def observe(self, seconds):
+		bucket = math.frexp(seconds*1e6)[1]
+		self.buckets[min(max(bucket, 0), BUCKETS - 1)] += 1
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+
+	def percentile(self, fraction):
+		"""Returns the upper bound in seconds of the bucket of fraction.
+		"""
+
+		rank = fraction*self.count
+		seen = 0
+		for bucket, count in enumerate(self.buckets):
+			seen += count
+			if count and seen >= rank:
+				return min(2**bucket/1e6, self.max)
+		return self.max
+
+	def snapshot(self):
+		mean = 0.0
+		if self.count:
+			mean = self.total/self.count
+		return dict(count=self.count, mean=mean, max=self.max,
+			p50=self.percentile(0.5), p90=self.percentile(0.9),
+			p99=self.percentile(0.99))
+
+
+class _Timer(object):
+	"""Context manager that observes its duration in a histogram.
+	"""
+
+	def __init__(self, registry, name):
+		self.registry = registry
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *exc):
+		self.registry.observe(self.name, time.time() - self.start)
+		return False
+
+
+class _NullTimer(object):
+	"""Timer used when metrics are disabled.
+	"""
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+NULL_TIMER = _NullTimer()
+
+
+class Registry(object):
+	"""Named counters and histograms, they can be shared between threads.
+	"""
+
+	def __init__(self, enabled=False):
+		self.enabled = enabled
+		self.lock = threading.Lock()
+		self.counters = dict()
+		self.histograms = dict()
+
+	def count(self, name, n=1):
+		if not self.enabled:
+			return
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+	def observe(self, name, seconds):
+		if not self.enabled:
+			return
+		with self.lock:
+			histogram = self.histograms.get(name)
+			if histogram is None:
+				histogram = self.histograms[name] = Histogram()
+			histogram.observe(seconds)
+
+	def timer(self, name):
+		if not self.enabled:
+			return NULL_TIMER
+		return _Timer(self, name)
+
+	def timed(self, name):
+		"""Decorator that observes the duration of the calls.
+		"""
+
+		def decorator(fn):
+			@wraps(fn)
+			def wrapper(*args, **kwargs):
+				if not self.enabled:
+					return fn(*args, **kwargs)
+				start = time.time()
+				try:
+					return fn(*args, **kwargs)
+				finally:
+					self.observe(name, time.time() - start)
+			return wrapper
+		return decorator
+
+	def reset(self):
+		with self.lock:
+			self.counters = dict()
+			self.histograms = dict()
+
+	def snapshot(self):
+		"""Returns the current values as a dict.
+		"""
+
+		with self.lock:
+			return dict(counters=dict(self.counters),
+				histograms=dict((name, histogram.snapshot())
+				for name, histogram in self.histograms.items()))
+
+	def dump(self, output):
+		"""Writes a human readable snapshot to output.
+		"""
+
+		snapshot = self.snapshot()
+		for name, value in sorted(snapshot['counters'].items()):
+			output.write('%-28s %d\n' % (name, value))
+		for name, h in sorted(snapshot['histograms'].items()):
+			output.write('%-28s n=%d mean=%.2fms p50<%.2fms p90<%.2fms '
+				'p99<%.2fms max=%.2fms\n' % (name, h['count'], h['mean']*1e3,
+				h['p50']*1e3, h['p90']*1e3, h['p99']*1e3, h['max']*1e3))
+		output.flush()
+
+
+registry = Registry()
+
+def enable(enabled=True):
+	registry.enabled = enabled
+
+def count(name, n=1):
+	registry.count(name, n)
+
+def observe(name, seconds):
+	registry.observe(name, seconds)
+
+def timer(name):
+	return registry.timer(name)
+
+def timed(name):
+	return registry.timed(name)
+
+def snapshot():
+	return registry.snapshot()
+
+def dump(output):
+	registry.dump(output)
+
+# EOF
@@ -0,0 +1,210 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Update scheduling: adaptive interval and retry policy.
+"""
+
+import logging
+import random
+import time
+
+class PollScheduler(object):
+	"""Adaptive update interval (in minutes).
+
+	When adaptive, the interval follows the rate the conditions (date and
+	code) change at, measured over the time elapsed between updates: it
+	aims at half the expected time between changes, moving at most by
+	STRETCH or SHRINK per update. It's always kept between minimum and
+	maximum.
+
+	The TTL of the feed is a hint: the interval isn't shrunk below it,
+	but a TTL above the base interval is ignored (and logged), so the
+	user configuration always wins.
+
+	Only updates from scheduled polls should be sampled; samples closer
+	than half the minimum to the previous one are ignored (ie. reused
+	results), allowing for the fetch latency of polls at the minimum.
+	"""
+
+	STRETCH = 1.5
+	SHRINK = 0.5
+	# weight of a new sample in the change rate
+	WEIGHT = 0.3
+
+	def __init__(self, interval, minimum, maximum, adaptive=True,
+		clock=time.time):
+		self.base = interval
+		self.minimum = minimum
+		self.maximum = maximum
+		self.adaptive = adaptive
+		self.clock = clock
+
+		self.interval = interval
+		self.ttl = 0
+		self.last = None
+		self.last_time = None
+		self.change_rate = None
+
+	def set_base(self, interval):
+		"""Sets a new base interval, the adaptive state is reset.
+		"""
+
+		self.base = interval
+		self.interval = interval
+		self.change_rate = None
+
+	def update(self, weather):
+		"""Updates the interval after a scheduled poll.
+		"""
+
+		try:
+			self.ttl = int(weather.get('channel', dict()).get('ttl'))
+		except (TypeError, ValueError):
+			self.ttl = 0
+
+		now = self.clock()
+		sample = (weather['condition']['date'], weather['condition']['code'])
+
+		if self.last is None:
+			# nothing to compare with yet
+			self.last = sample
+			self.last_time = now
+			return self.interval
+
+		elapsed = (now - self.last_time)/60.0
+		if elapsed < 0.5*self.minimum:
+			logging.debug('Update sample ignored, only %.1f min elapsed' %
+				elapsed)
+			return self.interval
+
+		changed = sample != self.last
+		self.last = sample
+		self.last_time = now
+
+		if not self.adaptive:
+			return self.interval
+
+		# changes per minute
+		rate = float(changed)/elapsed
+		if self.change_rate is None:
+			self.change_rate = rate
+		else:
+			self.change_rate = (1 - self.WEIGHT)*self.change_rate + \
+				self.WEIGHT*rate
+
+		if self.change_rate > 0:
+			target = 0.5/self.change_rate
+		else:
+			target = self.maximum
+		self.interval = min(max(target, self.interval*self.SHRINK),
+			self.interval*self.STRETCH)
+
+		lower = self.minimum
+		if self.ttl > self.base:
+			logging.debug('Feed TTL %d min above the base interval, '
+				'ignored' % self.ttl)
+		else:
+			lower = max(lower, self.ttl)
+		self.interval = min(max(lower, self.interval), self.maximum)
+
+		logging.debug('Update interval %.1f min (ttl %d, change rate '
+			'%.3f/min)' % (self.interval, self.ttl, self.change_rate))
+		return self.interval
+
+
+class CircuitBreaker(object):
+	"""Failure aware retry policy.
+
+	Failed updates are retried with exponential backoff and random
+	jitter. After threshold consecutive failures the circuit opens and
+	no request is allowed until cooldown seconds have passed, then a
+	single probe is allowed (half-open). Normal operation is resumed
+	only if the probe succeeds.
+	"""
+
+	CLOSED = 'closed'
+	OPEN = 'open'
+	HALF_OPEN = 'half-open'
+
+	def __init__(self, base=30, maximum=900, threshold=5, cooldown=1800,
+		clock=time.time):
+		self.base = base
+		self.maximum = maximum
+		self.threshold = threshold
+		self.cooldown = cooldown
+		self.clock = clock
+
+		self.state = self.CLOSED
+		self.failures = 0
+		self.opened = None
+		self.probing = False
+
+	def __str__(self):
+		return 'circuit %s, %d consecutive failures' % (self.state,
+			self.failures)
+
+	def _set_state(self, state):
+		if state != self.state:
+			self.state = state
+			logging.debug('Circuit breaker: %s' % self)
+
+	def allow(self):
+		"""Returns True if a request can be made now.
+		"""
+
+		if self.state == self.OPEN:
+			if self.clock() - self.opened < self.cooldown:
+				return False
+			self._set_state(self.HALF_OPEN)
+
+		if self.state == self.HALF_OPEN:
+			if self.probing:
+				return False
+			logging.debug('Circuit breaker: probing')
+			self.probing = True
+
+		return True
+
+	def success(self):
+		self.failures = 0
+		self.probing = False
+		self._set_state(self.CLOSED)
+
+	def failure(self):
+		self.failures += 1
+		self.probing = False
+
+		if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+			self.opened = self.clock()
+			self._set_state(self.OPEN)
+
+	def delay(self):
+		"""Returns the seconds to wait before retrying.
+
+		It's random to avoid many clients retrying at the same time.
+		"""
+
+		if self.state == self.OPEN:
+			remaining = self.cooldown - (self.clock() - self.opened)
+			return max(0, remaining) + random.uniform(0, self.base)
+
+		backoff = min(self.base*2**max(0, self.failures - 1), self.maximum)
+		return random.uniform(backoff/2.0, backoff)
+
+# EOF
@@ -0,0 +1,317 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Caching fan-out server.
+
+It fetches the weather once and serves it as JSON to any number of
+applets over HTTP, so a whole office needs a single fetch per location.
+An applet uses the server when its 'api' option points to it, ie:
+
+http://server:8080/weather?w=%s&u=%s
+
+It doesn't need GTK, run it with python -m oraje.server:
+
+Usage: python -m oraje.server [OPTIONS] [HOST:]PORT [WOEID...]
+
+OPTIONS:
+	-h, --help          This help screen
+	-d, --debug         Enable debug output
+	-t, --ttl=SECONDS   Time the server keeps the weather (default 900)
+	-a, --api=URL       Feeds URL, with %s for the WOEID and the units
+
+The weather of the WOEIDs in the arguments is fetched in advance.
+"""
+
+import sys
+import logging
+import threading
+import time
+import hashlib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+try:
+	import json
+except:
+	import simplejson as json
+
+from getopt import getopt
+
+from oraje.fetch import YAHOO_API, Fetcher
+from oraje.units import CANONICAL_UNITS, UNITS
+
+class SnapshotStore(object):
+	"""Parsed weather snapshots kept in memory.
+
+	Snapshots are keyed by (WOEID, units) and fetched again after ttl
+	seconds. Only one thread fetches a given key at a time, the others
+	wait for it. If the fetch fails, the expired snapshot is kept and
+	the key isn't fetched again for retry seconds.
+
+	At most size keys are kept, the least recently requested are
+	evicted first unless they are pinned or being fetched. It can be
+	shared between threads.
+	"""
+
+	def __init__(self, fetcher, ttl=900, clock=time.time, retry=60,
+		size=1024):
+		self.fetcher = fetcher
+		self.ttl = ttl
+		self.clock = clock
+		self.retry = retry
+		self.size = size
+
+		self.snapshots = dict()
+		self.failures = dict()
+		self.used = dict()
+		self.pinned = set()
+		self.locks = dict()
+		self.fetching = dict()
+		self.lock = threading.Lock()
+
+	def pin(self, w, c):
+		"""Never evict (w, c).
+		"""
+
+		self.pinned.add((w, c))
+
+	def get(self, w, c):
+		"""Returns the snapshot for (w, c), fetching it if needed.
+
+		A snapshot is a tuple of (fetched time, JSON body, ETag), or None
+		if it isn't available.
+		"""
+
+		now = self.clock()
+		self.used[(w, c)] = now
+
+		snapshot = self.snapshots.get((w, c))
+		if snapshot is not None and now - snapshot[0] < self.ttl:
+			return snapshot
+
+		if self._failed(w, c):
+			return snapshot
+
+		return self.refresh(w, c, snapshot)
+
+	def refresh(self, w, c, snapshot=None):
+		"""Fetches (w, c) unless another thread already did it.
+		"""
+
+		with self.lock:
+			lock = self.locks.get((w, c))
+			if lock is None:
+				if len(self.locks) >= self.size:
+					self._evict()
+				lock = self.locks[(w, c)] = threading.Lock()
+			self.fetching[(w, c)] = self.fetching.get((w, c), 0) + 1
+
+		try:
+			return self._refresh(w, c, snapshot, lock)
+		finally:
+			with self.lock:
+				self.fetching[(w, c)] -= 1
+				if not self.fetching[(w, c)]:
+					del self.fetching[(w, c)]
+
+	def _refresh(self, w, c, snapshot, lock):
+		with lock:
+			current = self.snapshots.get((w, c))
+			if current is not snapshot and current is not None:
+				# fetched while we were waiting
+				return current
+
+			if self._failed(w, c):
+				# failed while we were waiting
+				return current
+
+			weather = self.fetcher.fetch(w, c)
+			if weather is None:
+				logging.warning('Failed to fetch %s/%s' % (w, c))
+				self.failures[(w, c)] = self.clock()
+				return current
+
+			self.failures.pop((w, c), None)
+
+			body = json.dumps(weather)
+			snapshot = (self.clock(), body,
+				'"%s"' % hashlib.md5(body).hexdigest())
+			self.snapshots[(w, c)] = snapshot
+			logging.debug('Snapshot of %s/%s updated' % (w, c))
+			return snapshot
+
+	def _failed(self, w, c):
+		"""True if fetching (w, c) failed less than retry seconds ago.
+		"""
+
+		failed = self.failures.get((w, c))
+		return failed is not None and self.clock() - failed < self.retry
+
+	def _evict(self):
+		"""Drops the least recently requested quarter of the keys.
+
+		Must be called holding the store lock.
+		"""
+
+		keys = [key for key in self.locks.keys()
+			if key not in self.pinned and key not in self.fetching]
+		keys.sort(key=lambda key: self.used.get(key, 0))
+
+		evicted = keys[:max(1, self.size // 4)]
+		for key in evicted:
+			del self.locks[key]
+			self.snapshots.pop(key, None)
+			self.failures.pop(key, None)
+			self.used.pop(key, None)
+
+		logging.debug('Evicted %d snapshots' % len(evicted))
+
+
+class SnapshotHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""Serves the snapshots of the server's store.
+
+	GET /weather?w=WOEID&u=UNITS returns the weather in JSON format,
+	supporting conditional requests with If-None-Match.
+	"""
+
+	protocol_version = 'HTTP/1.1'
+	# drop idle keep-alive connections, each one holds a thread
+	timeout = 60
+
+	def do_GET(self):
+		(path, sep, query) = self.path.partition('?')
+		if path != '/weather':
+			return self._reply(404)
+
+		params = urlparse.parse_qs(query)
+		w = params.get('w', [''])[0]
+		c = params.get('u', [CANONICAL_UNITS])[0]
+		if not w.isdigit() or c not in UNITS:
+			return self._reply(400)
+
+		snapshot = self.server.store.get(w, c)
+		if snapshot is None:
+			return self._reply(502)
+
+		(fetched, body, etag) = snapshot
+		max_age = max(0, int(self.server.store.ttl - (time.time() - fetched)))
+		headers = dict(ETag=etag)
+		headers['Cache-Control'] = 'max-age=%d' % max_age
+
+		if self.headers.getheader('If-None-Match') == etag:
+			return self._reply(304, headers)
+
+		headers['Content-Type'] = 'application/json'
+		self._reply(200, headers, body)
+
+	def _reply(self, code, headers=dict(), body=''):
+		self.send_response(code)
+		for header, value in headers.items():
+			self.send_header(header, value)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		logging.debug('%s %s' % (self.client_address[0], format % args))
+
+
+class SnapshotServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	"""Threaded HTTP server for a SnapshotStore.
+	"""
+
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address, store):
+		BaseHTTPServer.HTTPServer.__init__(self, address, SnapshotHandler)
+		self.store = store
+
+
+def serve(address, locations=[], ttl=900, fetcher=None):
+	"""Runs the server on address (host, port) until interrupted.
+
+	The weather of locations is fetched in advance and kept up to date,
+	any other location is fetched the first time it's requested.
+	"""
+
+	if fetcher is None:
+		fetcher = Fetcher()
+
+	store = SnapshotStore(fetcher, ttl)
+	for woeid in locations:
+		store.pin(woeid, CANONICAL_UNITS)
+
+	def prefetch():
+		while True:
+			for woeid in locations:
+				store.refresh(woeid, CANONICAL_UNITS,
+					store.snapshots.get((woeid, CANONICAL_UNITS)))
+			time.sleep(ttl)
+
+	if locations:
+		thread = threading.Thread(target=prefetch, name='Prefetch')
+		thread.daemon = True
+		thread.start()
+
+	server = SnapshotServer(address, store)
+	logging.info('Serving on %s:%d' % server.server_address)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+
+
+def main(argv):
+	"""Command line entry point, returns the exit status.
+	"""
+
+	(opts, args) = getopt(argv, 'hdt:a:', ['help', 'debug', 'ttl=',
+		'api='])
+
+	ttl = 900
+	api = YAHOO_API
+
+	for op, ar in opts:
+		if op in ('-h', '--help'):
+			print __doc__
+			return 0
+		elif op in ('-d', '--debug'):
+			logging.getLogger().setLevel(logging.DEBUG)
+		elif op in ('-t', '--ttl'):
+			ttl = int(ar)
+		elif op in ('-a', '--api'):
+			api = ar
+
+	if not args:
+		print __doc__
+		return 1
+
+	(host, sep, port) = args[0].rpartition(':')
+	serve((host or '127.0.0.1', int(port)), args[1:], ttl,
+		Fetcher(api=api))
+	return 0
+
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO)
+	sys.exit(main(sys.argv[1:]))
+
+# EOF
@@ -0,0 +1,218 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Statistics over the history of observations.
+
+Requires numpy.
+"""
+
+import logging
+import time
+try:
+	import json
+except:
+	import simplejson as json
+
+import numpy
+
+from oraje.history import History
+
+DAY = 86400
+
+# fields with meaningful min/max/mean
+STAT_FIELDS = ['temp', 'chill', 'wind_speed', 'humidity', 'pressure',
+	'visibility']
+
+class Samples(object):
+	"""History of a location loaded into numpy arrays.
+
+	times holds the observation times and values a row per observation
+	with the History.COLUMNS fields (missing values are NaN).
+	"""
+
+	def __init__(self):
+		self.times = numpy.zeros(0, dtype=numpy.int64)
+		self.values = numpy.zeros((0, len(History.COLUMNS) - 1))
+
+	def __len__(self):
+		return len(self.times)
+
+	def extend(self, rows):
+		"""Appends History rows, newer than the loaded ones.
+		"""
+
+		rows = numpy.array(rows, dtype=numpy.float64)
+		self.times = numpy.concatenate((self.times,
+			rows[:, 0].astype(numpy.int64)))
+		self.values = numpy.vstack((self.values, rows[:, 1:]))
+
+	def column(self, field):
+		return self.values[:, History.COLUMNS.index(field) - 1]
+
+
+class Statistics(object):
+	"""Vectorized statistics of the locations in a History.
+
+	Samples are loaded incrementally from the history. Daily stats are
+	cached per (woeid, day) and a day is only computed again when new
+	samples of that day arrive.
+
+	Days are the location's local days, as observation times are.
+	"""
+
+	def __init__(self, history):
+		self.history = history
+		self.samples = dict()
+		self.cache = dict()
+
+	def load(self, woeid):
+		"""Loads any new samples of woeid, returns its Samples.
+		"""
+
+		woeid = int(woeid)
+		samples = self.samples.setdefault(woeid, Samples())
+
+		start = 0
+		if len(samples):
+			start = int(samples.times[-1]) + 1
+
+		rows = self.history.range(woeid, start)
+		if rows:
+			samples.extend(rows)
+			for day in range(rows[0][0]//DAY, rows[-1][0]//DAY + 1):
+				self.cache.pop((woeid, day), None)
+			logging.debug('Loaded %d samples of woeid %s' % (len(rows), woeid))
+
+		return samples
+
+	def daily(self, woeid):
+		"""Returns the daily stats of woeid, sorted by day.
+
+		Each item is (day, stats) with day as days since the epoch and
+		stats as a dict of field: (min, max, mean) for STAT_FIELDS. Fields
+		without samples in a day are NaN.
+		"""
+
+		woeid = int(woeid)
+		samples = self.load(woeid)
+		if not len(samples):
+			return []
+
+		days = samples.times//DAY
+		starts = numpy.flatnonzero(numpy.diff(days)) + 1
+		starts = numpy.concatenate(([0], starts))
+
+		# cached days are never newer than the first day missing
+		missing = [i for i, day in enumerate(days[starts].tolist())
+			if (woeid, day) not in self.cache]
+		if missing:
+			self._compute(woeid, samples, days, starts[missing[0]:])
+
+		return [(day, self.cache[(woeid, day)])
+			for day in days[starts].tolist()]
+
+	def _compute(self, woeid, samples, days, starts):
+		first = starts[0]
+		offsets = starts - first
+
+		stats = dict()
+		for field in STAT_FIELDS:
+			values = samples.column(field)[first:]
+			valid = ~numpy.isnan(values)
+			count = numpy.add.reduceat(valid, offsets)
+			total = numpy.add.reduceat(numpy.where(valid, values, 0), offsets)
+
+			with numpy.errstate(invalid='ignore', divide='ignore'):
+				mean = total/count
+			stats[field] = (numpy.fmin.reduceat(values, offsets),
+				numpy.fmax.reduceat(values, offsets), mean)
+
+		for i, day in enumerate(days[starts].tolist()):
+			self.cache[(woeid, day)] = dict((field,
+				(float(low[i]), float(high[i]), float(mean[i])))
+				for field, (low, high, mean) in stats.items())
+
+	def rolling(self, woeid, field, window=3*3600):
+		"""Returns the rolling average of field over window seconds.
+
+		Returns (times, averages) arrays, the average at each observation
+		time is the mean of the observations in (time - window, time].
+		"""
+
+		samples = self.load(woeid)
+		times = samples.times
+		values = samples.column(field)
+
+		valid = ~numpy.isnan(values)
+		totals = numpy.concatenate(([0],
+			numpy.cumsum(numpy.where(valid, values, 0))))
+		counts = numpy.concatenate(([0], numpy.cumsum(valid)))
+
+		low = numpy.searchsorted(times, times - window, side='right')
+		high = numpy.arange(1, len(times) + 1)
+
+		with numpy.errstate(invalid='ignore', divide='ignore'):
+			averages = (totals[high] - totals[low])/(counts[high] - counts[low])
+
+		return (times, averages)
+
+	def tendency(self, woeid, period=3*3600):
+		"""Returns the pressure tendency of woeid, change over period.
+
+		The pressure period seconds before the last observation is
+		interpolated. Returns None if the history doesn't cover the
+		period.
+		"""
+
+		samples = self.load(woeid)
+		pressure = samples.column('pressure')
+		valid = ~numpy.isnan(pressure)
+
+		times = samples.times[valid]
+		pressure = pressure[valid]
+		if not len(times) or times[-1] - times[0] < period:
+			return None
+
+		before = numpy.interp(times[-1] - period, times, pressure)
+		return float(pressure[-1] - before)
+
+
+def report(history, woeid, output):
+	"""Writes the daily stats of woeid to output, as JSON lines.
+
+	A line per day, {"day": "YYYY-MM-DD", field: {"min", "max", "mean"}},
+	NaN values are written as null. Returns the number of days.
+	"""
+
+	statistics = Statistics(history)
+	days = statistics.daily(woeid)
+
+	for day, stats in days:
+		line = dict(day=time.strftime('%Y-%m-%d', time.gmtime(day*DAY)))
+		for field, values in stats.items():
+			line[field] = dict()
+			for name, value in zip(('min', 'max', 'mean'), values):
+				if numpy.isnan(value):
+					value = None
+				line[field][name] = value
+		output.write('%s\n' % json.dumps(line, sort_keys=True))
+
+	return len(days)
+
+# EOF
@@ -0,0 +1,159 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Theme loading.
+"""
+
+import os
+import logging
+import marshal
+try:
+	import json
+except:
+	import simplejson as json
+
+class Theme(object):
+	"""Compiled theme.
+
+	Conditions are kept in a list indexed by condition code (0 to 47, and
+	3200 in the last slot), each one as a tuple of (status, description,
+	absolute icon path).
+	"""
+
+	# compiled format version, bump on changes
+	VERSION = 1
+
+	NOT_AVAILABLE = 3200
+	SLOTS = 49
+
+	def __init__(self, theme_file, mtime, icons, conditions):
+		self.theme_file = theme_file
+		self.mtime = mtime
+		self.icons = icons
+		self.conditions = conditions
+
+	@classmethod
+	def slot(cls, code):
+		"""Returns the slot for a condition code, or None if invalid.
+		"""
+
+		try:
+			code = int(code)
+		except (TypeError, ValueError):
+			return None
+
+		if code == cls.NOT_AVAILABLE:
+			return cls.SLOTS - 1
+		if code < 0 or code >= cls.SLOTS - 1:
+			return None
+		return code
+
+	def has(self, code):
+		slot = self.slot(code)
+		return slot is not None and self.conditions[slot] is not None
+
+	def status(self, code):
+		return self.conditions[self.slot(code)][0]
+
+	def desc(self, code):
+		return self.conditions[self.slot(code)][1]
+
+	def icon(self, code):
+		return self.conditions[self.slot(code)][2]
+
+	@classmethod
+	def compile(cls, theme_file):
+		"""Parses and validates a theme in JSON format.
+
+		Raises ValueError if the theme is not valid.
+		"""
+
+		mtime = os.stat(theme_file).st_mtime
+		theme_fd = open(theme_file, 'r')
+		try:
+			theme = json.load(theme_fd)
+		finally:
+			theme_fd.close()
+
+		for key in ('base', 'status', 'conditions'):
+			if not key in theme:
+				raise ValueError('%s not found' % key)
+
+		icons = dict()
+		for status, icon in theme['status'].items():
+			icons[status] = os.path.join(theme['base'], icon)
+
+		conditions = [None]*cls.SLOTS
+		for code, condition in theme['conditions'].items():
+			slot = cls.slot(code)
+			if slot is None:
+				raise ValueError('invalid condition code %s' % code)
+			if not condition.get('status') in icons:
+				raise ValueError('unknown status for condition %s' % code)
+			conditions[slot] = (condition['status'],
+				condition.get('desc', ''), icons[condition['status']])
+
+		missing = [str(code) for code in range(cls.SLOTS - 1) +
+			[cls.NOT_AVAILABLE] if conditions[cls.slot(code)] is None]
+		if missing:
+			logging.warning('Theme without conditions: %s' %
+				', '.join(missing))
+
+		return cls(theme_file, mtime, sorted(icons.values()), conditions)
+
+	@classmethod
+	def load(cls, theme_file, compiled_file):
+		"""Loads a compiled theme, compiling it if needed.
+
+		The compiled theme is stored in compiled_file, and it's
+		discarded when the theme file or its modification time change.
+		"""
+
+		mtime = os.stat(theme_file).st_mtime
+
+		try:
+			compiled_fd = open(compiled_file, 'rb')
+			try:
+				data = marshal.load(compiled_fd)
+			finally:
+				compiled_fd.close()
+
+			(version, compiled_theme, compiled_mtime, icons,
+				conditions) = data
+			if version == cls.VERSION and compiled_theme == theme_file \
+				and compiled_mtime == mtime:
+				logging.debug('Using compiled theme %s' % compiled_file)
+				return cls(theme_file, mtime, icons, conditions)
+		except (IOError, EOFError, ValueError, TypeError) as e:
+			logging.debug('No valid compiled theme: %s' % e)
+
+		theme = cls.compile(theme_file)
+
+		try:
+			compiled_fd = open('%s.tmp' % compiled_file, 'wb')
+			marshal.dump((cls.VERSION, theme.theme_file, theme.mtime,
+				theme.icons, theme.conditions), compiled_fd)
+			compiled_fd.close()
+			os.rename('%s.tmp' % compiled_file, compiled_file)
+		except Exception as e:
+			logging.error('Failed to save %s: %s' % (compiled_file, e))
+
+		return theme
+
+# EOF
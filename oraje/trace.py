@@ -0,0 +1,190 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Span trees of refreshes, written as JSON lines.
+
+Tracing is disabled until configure() is called, then a fraction of the
+traces (sample) are written to a rotating log file. A trace is started
+with start() and spans are nested under the span active in the current
+thread:
+
+	root = trace.start('refresh')
+	with root.child('fetch', woeid=w):
+		with trace.span('parse'):
+			...
+	root.end()
+
+When a trace isn't sampled all its spans are NULL_SPAN, that does
+nothing.
+"""
+
+import time
+import random
+import socket
+import logging
+import logging.handlers
+import threading
+from functools import wraps
+try:
+	import json
+except:
+	import simplejson as json
+
+logger = logging.getLogger('oraje.trace')
+logger.propagate = False
+
+_local = threading.local()
+_ids = iter(xrange(1, 2**62)).next
+_sample = 0.0
+
+def configure(log_file, sample=1.0, max_bytes=1024*1024, backups=3):
+	"""Enables tracing, writing sample (0 to 1) of the traces to log_file.
+	"""
+
+	global _sample
+
+	handler = logging.handlers.RotatingFileHandler(log_file,
+		maxBytes=max_bytes, backupCount=backups)
+	handler.setFormatter(logging.Formatter('%(message)s'))
+	logger.addHandler(handler)
+	logger.setLevel(logging.INFO)
+
+	_sample = sample
+
+
+def _stack():
+	stack = getattr(_local, 'stack', None)
+	if stack is None:
+		stack = _local.stack = []
+	return stack
+
+
+class Span(object):
+	"""A timed operation of a trace.
+
+	Used as context manager the span is active in the current thread
+	while it runs, and ended on exit. It's written when it ends.
+	"""
+
+	def __init__(self, trace, name, parent=None, attrs=None):
+		self.trace = trace
+		self.id = _ids()
+		self.parent = parent
+		self.name = name
+		self.attrs = attrs or dict()
+		self.start = time.time()
+
+	def __enter__(self):
+		return self.activate()
+
+	def __exit__(self, exc_type, exc, tb):
+		if exc_type is not None:
+			self.attrs['error'] = '%s: %s' % (exc_type.__name__, exc)
+		self.end()
+		return False
+
+	def set(self, **attrs):
+		self.attrs.update(attrs)
+
+	def child(self, name, **attrs):
+		return Span(self.trace, name, self.id, attrs)
+
+	def activate(self):
+		"""Makes the span the parent of new spans in the current thread.
+		"""
+
+		_stack().append(self)
+		return self
+
+	def end(self):
+		"""Ends the span, deactivating it if it's active.
+		"""
+
+		stack = _stack()
+		if self in stack:
+			stack.remove(self)
+
+		logger.info(json.dumps(dict(trace=self.trace, span=self.id,
+			parent=self.parent, name=self.name, start=self.start,
+			duration=time.time() - self.start,
+			thread=threading.current_thread().name, attrs=self.attrs)))
+
+
+class _NullSpan(object):
+	"""Span of a trace not sampled, or of no trace at all.
+	"""
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+	def set(self, **attrs):
+		pass
+
+	def child(self, name, **attrs):
+		return self
+
+	def activate(self):
+		return self
+
+	def end(self):
+		pass
+
+NULL_SPAN = _NullSpan()
+
+
+def start(name, **attrs):
+	"""Starts a trace, returns its root span.
+
+	Trace ids are random and the root has the host name, so traces of
+	different desktops can be put together. It must be ended with end(),
+	even if it's not activated.
+	"""
+
+	if not _sample or random.random() >= _sample:
+		return NULL_SPAN
+	attrs['host'] = socket.gethostname()
+	return Span('%016x' % random.getrandbits(64), name, None, attrs)
+
+
+def span(name, **attrs):
+	"""Returns a child of the span active in the current thread.
+	"""
+
+	stack = getattr(_local, 'stack', None)
+	if not stack:
+		return NULL_SPAN
+	return stack[-1].child(name, **attrs)
+
+
+def traced(name):
+	"""Decorator that runs the calls in a span.
+	"""
+
+	def decorator(fn):
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			with span(name):
+				return fn(*args, **kwargs)
+		return wrapper
+	return decorator
+
+# EOF
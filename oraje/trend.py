@@ -0,0 +1,158 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Recent observations, for trend sparklines.
+"""
+
+from array import array
+
+from oraje.units import CANONICAL_UNITS, convert_units
+from oraje.history import History, observation_time
+
+class Ring(object):
+	"""Fixed size ring buffer of floats.
+
+	Storage is a preallocated array('d'), appending doesn't allocate.
+	"""
+
+	def __init__(self, size):
+		self.data = array('d', [0.0])*size
+		self.size = size
+		self.start = 0
+		self.count = 0
+
+	def __len__(self):
+		return self.count
+
+	def append(self, value):
+		end = (self.start + self.count) % self.size
+		self.data[end] = value
+		if self.count < self.size:
+			self.count += 1
+		else:
+			self.start = (self.start + 1) % self.size
+
+	def values(self):
+		"""Returns the values as an array('d'), oldest first.
+		"""
+
+		end = self.start + self.count
+		if end <= self.size:
+			return self.data[self.start:end]
+		return self.data[self.start:] + self.data[:end - self.size]
+
+
+class Trends(object):
+	"""Recent observations of a location, one Ring per field.
+
+	Values are kept in CANONICAL_UNITS; sparklines are scaled to their
+	range so the units don't change their shape.
+	"""
+
+	# field: (node, field)
+	FIELDS = dict(
+		temp = ('condition', 'temp'),
+		pressure = ('atmosphere', 'pressure'),
+	)
+
+	def __init__(self, size=48):
+		self.rings = dict((field, Ring(size)) for field in self.FIELDS)
+		self.size = size
+		self.time = None
+
+	def seed(self, rows, columns=History.COLUMNS):
+		"""Fills the rings with History rows, oldest first.
+		"""
+
+		time = columns.index('time')
+		indexes = [(field, columns.index(field)) for field in self.FIELDS]
+
+		for row in rows:
+			for field, index in indexes:
+				if row[index] is not None:
+					self.rings[field].append(row[index])
+			self.time = row[time]
+
+	def append(self, weather):
+		"""Appends an observation, unless it's not newer than the last one.
+		"""
+
+		time = observation_time(weather['condition']['date'])
+		if self.time is not None and time <= self.time:
+			return False
+		self.time = time
+
+		weather = convert_units(weather, CANONICAL_UNITS)
+		for field, (node, name) in self.FIELDS.items():
+			try:
+				self.rings[field].append(float(weather[node][name]))
+			except (KeyError, ValueError):
+				pass
+
+		return True
+
+
+# numpy is imported on first use, so importing oraje doesn't load it
+_numpy = None
+
+def _import_numpy():
+	global _numpy
+
+	if _numpy is None:
+		try:
+			import numpy
+			_numpy = numpy
+		except ImportError:
+			_numpy = False
+
+	return _numpy
+
+
+def sparkline(values, width, height, margin=2):
+	"""Scales values to points in a width x height area.
+
+	Values are spread evenly in the x axis and scaled to their range in
+	the y axis (the maximum on top). Returns a sequence of (x, y) pairs,
+	vectorized with numpy when available.
+	"""
+
+	count = len(values)
+	if count < 2:
+		return []
+
+	width -= 2*margin
+	height -= 2*margin
+
+	numpy = _import_numpy()
+	if numpy:
+		ys = numpy.frombuffer(values, dtype=numpy.float64)
+		low = ys.min()
+		span = (ys.max() - low) or 1.0
+		xs = numpy.arange(count)*(float(width)/(count - 1)) + margin
+		ys = margin + height - (ys - low)*(height/span)
+		return numpy.column_stack((xs, ys))
+
+	low = min(values)
+	span = (max(values) - low) or 1.0
+	step = float(width)/(count - 1)
+	scale = height/span
+	return [(margin + i*step, margin + height - (value - low)*scale)
+		for i, value in enumerate(values)]
+
+# EOF
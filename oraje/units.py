@@ -0,0 +1,91 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Unit conversion.
+
+Yahoo! Weather uses metric units when Celsius data is requested, and
+imperial units when Fahrenheit is requested. The weather is fetched in
+CANONICAL_UNITS and converted locally when it's shown.
+"""
+
+# weather is always fetched in these units and converted when shown
+CANONICAL_UNITS = 'c'
+
+# units used by Yahoo! Weather for each unit system
+UNITS = dict(
+	c = dict(temperature='C', distance='km', pressure='mb', speed='km/h'),
+	f = dict(temperature='F', distance='mi', pressure='in', speed='mph'),
+)
+
+# (from, to): (conversion, decimal digits)
+CONVERSIONS = {
+	('C', 'F'): (lambda v: v*9.0/5.0 + 32, 0),
+	('F', 'C'): (lambda v: (v - 32)*5.0/9.0, 0),
+	('km', 'mi'): (lambda v: v/1.609344, 2),
+	('mi', 'km'): (lambda v: v*1.609344, 2),
+	('mb', 'in'): (lambda v: v/33.8639, 2),
+	('in', 'mb'): (lambda v: v*33.8639, 1),
+	('km/h', 'mph'): (lambda v: v/1.609344, 0),
+	('mph', 'km/h'): (lambda v: v*1.609344, 2),
+}
+
+# weather fields affected by units: (node, field, unit)
+UNIT_FIELDS = [
+	('condition', 'temp', 'temperature'),
+	('wind', 'chill', 'temperature'),
+	('wind', 'speed', 'speed'),
+	('atmosphere', 'pressure', 'pressure'),
+	('atmosphere', 'visibility', 'distance'),
+]
+
+def convert_units(weather, units):
+	"""Returns weather converted into units ('c' or 'f').
+
+	The weather dict isn't modified, a converted copy is returned
+	unless no conversion is needed. Values that can't be converted
+	(ie. empty) are left as they are.
+	"""
+
+	target = UNITS[units]
+	if weather['units'] == target:
+		return weather
+
+	converted = dict()
+	for node, values in weather.items():
+		converted[node] = dict(values)
+
+	for node, field, unit in UNIT_FIELDS:
+		conversion = CONVERSIONS.get((weather['units'][unit], target[unit]))
+		if conversion is None:
+			continue
+
+		try:
+			value = conversion[0](float(weather[node][field]))
+		except ValueError:
+			continue
+
+		if conversion[1]:
+			converted[node][field] = '%.*f' % (conversion[1], value)
+		else:
+			converted[node][field] = '%d' % int(round(value))
+
+	converted['units'] = dict(target)
+	return converted
+
+# EOF
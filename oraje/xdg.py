@@ -0,0 +1,88 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""User directories, as defined by the XDG Base Directory Specification.
+"""
+
+import os
+import logging
+
+PACKAGE = 'OrajeApplet'
+
+def _user_dir(variable, default):
+	"""Returns the applet's directory in a user's base directory.
+
+	The base directory is taken from the environment variable, or the
+	default path under HOME. It's created if needed.
+	"""
+
+	if variable in os.environ:
+		base_dir = os.environ[variable]
+	else:
+		base_dir = os.path.join(os.environ['HOME'], default)
+
+	user_dir = os.path.join(base_dir, PACKAGE)
+	if not os.path.isdir(user_dir):
+		try:
+			os.makedirs(user_dir)
+		except OSError as e:
+			logging.error('Failed to create %s: %s' % (user_dir, e))
+
+	return user_dir
+
+
+def cache_dir():
+	"""Returns the applet's cache directory, creating it if needed.
+
+	The directory will be located in user's cache directory determined
+	by one of the following methods:
+
+	- XDG_CACHE_HOME environment variable
+	- HOME environment variable followed by /.cache/
+	"""
+
+	return _user_dir('XDG_CACHE_HOME', '.cache')
+
+
+def data_dir():
+	"""Returns the applet's data directory, creating it if needed.
+
+	The directory will be located in user's data directory determined
+	by one of the following methods:
+
+	- XDG_DATA_HOME environment variable
+	- HOME environment variable followed by /.local/share/
+	"""
+
+	return _user_dir('XDG_DATA_HOME', os.path.join('.local', 'share'))
+
+
+def state_dir():
+	"""Returns the applet's state directory, creating it if needed.
+
+	The directory will be located in user's state directory determined
+	by one of the following methods:
+
+	- XDG_STATE_HOME environment variable
+	- HOME environment variable followed by /.local/state/
+	"""
+
+	return _user_dir('XDG_STATE_HOME', os.path.join('.local', 'state'))
+
+# EOF
@@ -48,6 +48,7 @@ setup(name='OrajeApplet',
 	url='http://www.usebox.net/jjm/orajeapplet/',
 	license='http://www.gnu.org/licenses/gpl-3.0.html',
 	cmdclass={ 'build': build, 'install_data': install_data },
+	packages=['oraje'],
 	scripts=['OrajeApplet.py'],
 	data_files=[('lib/bonobo/servers/', ['OrajeApplet.server']),
 		('share/gnome-2.0/ui/', ['OrajeApplet.xml']),
@@ -0,0 +1,61 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Tests of the oraje core library.
+
+Run them from the top of the source tree:
+
+	$ python -m unittest discover
+
+They don't need GTK nor network access, the fetch tests use the
+recorded feeds of bench/feedserver.py.
+"""
+
+import os
+import copy
+
+import oraje
+
+TOP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FEEDS_DIR = os.path.join(TOP_DIR, 'bench', 'feeds')
+
+def recorded(woeid='32997'):
+	"""Returns the recorded feed of woeid, parsed.
+	"""
+
+	feed_fd = open(os.path.join(FEEDS_DIR, '%s.xml' % woeid), 'r')
+	weather = oraje.rss_to_weather(feed_fd)
+	feed_fd.close()
+	return weather
+
+
+def observation(date, **fields):
+	"""Returns the recorded weather with another date and fields.
+
+	fields are node_field=value, ie. condition_temp='10'.
+	"""
+
+	weather = copy.deepcopy(recorded())
+	weather['condition']['date'] = date
+	for name, value in fields.items():
+		(node, field) = name.split('_', 1)
+		weather[node][field] = value
+	return weather
+
+# EOF
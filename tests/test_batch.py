@@ -0,0 +1,140 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+import unittest
+from StringIO import StringIO
+try:
+	import json
+except:
+	import simplejson as json
+
+from oraje.batch import RateLimiter, read_woeids, run
+
+from tests import recorded
+
+class Clock(object):
+	"""Manual clock, sleeping advances it.
+	"""
+
+	def __init__(self):
+		self.now = 0.0
+		self.sleeps = []
+
+	def __call__(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+
+class RateLimiterTest(unittest.TestCase):
+
+	def test_no_limit(self):
+		clock = Clock()
+		limiter = RateLimiter(0, clock, clock.sleep)
+		for i in range(10):
+			limiter.wait()
+		self.assertEqual(clock.sleeps, [])
+
+	def test_rate(self):
+		clock = Clock()
+		limiter = RateLimiter(4, clock, clock.sleep)
+		for i in range(5):
+			limiter.wait()
+
+		self.assertEqual(clock.sleeps, [0.25]*4)
+		self.assertEqual(clock.now, 1.0)
+
+	def test_idle(self):
+		clock = Clock()
+		limiter = RateLimiter(4, clock, clock.sleep)
+		limiter.wait()
+
+		# the unused slots aren't saved for later
+		clock.now = 10
+		limiter.wait()
+		limiter.wait()
+		self.assertEqual(clock.sleeps, [0.25])
+
+	def test_threads(self):
+		clock = Clock()
+		lock = threading.Lock()
+		waits = []
+
+		def sleep(seconds):
+			with lock:
+				waits.append(seconds)
+
+		limiter = RateLimiter(10, clock, sleep)
+		threads = [threading.Thread(target=limiter.wait) for i in range(5)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		# each thread gets its own slot
+		self.assertEqual(sorted('%.1f' % wait for wait in waits),
+			['0.1', '0.2', '0.3', '0.4'])
+
+
+class Upstream(object):
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.fetches = 0
+
+	def fetch(self, w, c):
+		with self.lock:
+			self.fetches += 1
+		if w == 'broken':
+			raise IOError('broken')
+		if w != '32997':
+			return None
+		return recorded(w)
+
+
+class RunTest(unittest.TestCase):
+
+	def test_read_woeids(self):
+		stream = StringIO('32997\n\n# comment\n  766273 \n')
+		self.assertEqual(list(read_woeids(stream)), ['32997', '766273'])
+
+	def test_run(self):
+		upstream = Upstream()
+		output = StringIO()
+
+		woeids = ['32997']*20 + ['1', 'broken']
+		self.assertEqual(run(iter(woeids), output, 4, fetcher=upstream),
+			(20, 2))
+		self.assertEqual(upstream.fetches, 22)
+
+		lines = [json.loads(line) for line in output.getvalue().splitlines()]
+		self.assertEqual(len(lines), 22)
+		self.assertEqual(sorted(line['woeid'] for line in lines
+			if 'error' in line), ['1', 'broken'])
+		weather = [line['weather'] for line in lines if 'weather' in line]
+		self.assertEqual(weather[0], json.loads(json.dumps(recorded())))
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
@@ -0,0 +1,96 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+from StringIO import StringIO
+
+from oraje import rss_to_weather, translate_wind, convert_units, UNITS
+
+from tests import recorded
+
+class FeedTest(unittest.TestCase):
+
+	def test_rss_to_weather(self):
+		weather = recorded('32997')
+
+		self.assertEqual(weather['location']['city'], 'Reading')
+		self.assertEqual(weather['units'], UNITS['c'])
+		self.assertEqual(weather['condition']['code'], '11')
+		self.assertEqual(weather['condition']['temp'], '8')
+		self.assertEqual(weather['condition']['date'],
+			'Wed, 14 Dec 2011 6:50 pm GMT')
+		self.assertEqual(weather['wind']['direction'], '230')
+		self.assertEqual(weather['atmosphere']['pressure'], '1006.1')
+		self.assertEqual(weather['channel']['ttl'], '60')
+
+	def test_rss_to_weather_broken(self):
+		self.assertRaises(Exception, rss_to_weather,
+			StringIO('<rss><channel><title>'))
+
+	def test_translate_wind(self):
+		self.assertEqual(translate_wind(0), 'N')
+		self.assertEqual(translate_wind(230), 'SW')
+		self.assertEqual(translate_wind(350), 'N')
+
+
+class UnitsTest(unittest.TestCase):
+
+	def test_same_units(self):
+		weather = recorded()
+		self.assertTrue(convert_units(weather, 'c') is weather)
+
+	def test_convert(self):
+		weather = recorded()
+		converted = convert_units(weather, 'f')
+
+		self.assertEqual(converted['units'], UNITS['f'])
+		self.assertEqual(converted['condition']['temp'], '46')
+		self.assertEqual(converted['wind']['chill'], '39')
+		self.assertEqual(converted['wind']['speed'], '15')
+		self.assertEqual(converted['atmosphere']['pressure'], '29.71')
+		self.assertEqual(converted['atmosphere']['visibility'], '6.21')
+		# not affected by units
+		self.assertEqual(converted['wind']['direction'], '230')
+
+		# the original isn't modified
+		self.assertEqual(weather['units'], UNITS['c'])
+		self.assertEqual(weather['condition']['temp'], '8')
+
+	def test_round_trip(self):
+		weather = recorded()
+		back = convert_units(convert_units(weather, 'f'), 'c')
+
+		self.assertEqual(back['units'], UNITS['c'])
+		self.assertEqual(back['condition']['temp'], '8')
+		self.assertAlmostEqual(float(back['atmosphere']['pressure']),
+			1006.1, 0)
+
+	def test_empty_values(self):
+		weather = recorded()
+		weather['wind']['chill'] = ''
+		converted = convert_units(weather, 'f')
+
+		self.assertEqual(converted['wind']['chill'], '')
+		self.assertEqual(converted['condition']['temp'], '46')
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
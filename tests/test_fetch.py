@@ -0,0 +1,258 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import Queue
+
+from oraje import FeedCache, Fetcher, FetchPool, FetchCoordinator
+
+from tests import TOP_DIR
+
+sys.path.insert(0, os.path.join(TOP_DIR, 'bench'))
+import feedserver
+
+class FeedCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.cache_file = os.path.join(self.tmp_dir, 'feeds.json')
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp_dir)
+
+	def test_validators(self):
+		cache = FeedCache(self.cache_file)
+		self.assertEqual(cache.validators('32997', 'c'), dict())
+
+		cache.store('32997', 'c', '"etag"', 'Wed, 14 Dec 2011 18:50:00 GMT',
+			'body')
+		self.assertEqual(cache.validators('32997', 'c'),
+			{'If-None-Match': '"etag"',
+			'If-Modified-Since': 'Wed, 14 Dec 2011 18:50:00 GMT'})
+		self.assertEqual(cache.validators('32997', 'f'), dict())
+
+	def test_save_and_load(self):
+		cache = FeedCache(self.cache_file)
+		cache.store('32997', 'c', '"etag"', None, 'body')
+		cache.save()
+
+		cache = FeedCache(self.cache_file)
+		cache.load()
+		entry = cache.get('32997', 'c')
+		self.assertEqual(entry['body'], 'body')
+		self.assertEqual(entry['etag'], '"etag"')
+		self.assertEqual(cache.validators('32997', 'c'),
+			{'If-None-Match': '"etag"'})
+
+	def test_missing_and_broken(self):
+		cache = FeedCache(self.cache_file)
+		cache.load()
+		self.assertEqual(cache.entries, dict())
+
+		cache_fd = open(self.cache_file, 'w')
+		cache_fd.write('{broken')
+		cache_fd.close()
+		cache.load()
+		self.assertEqual(cache.entries, dict())
+
+
+class FetcherTest(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.cache = FeedCache(os.path.join(self.tmp_dir, 'feeds.json'))
+		self.server = feedserver.start()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		shutil.rmtree(self.tmp_dir)
+
+	def test_not_modified(self):
+		fetcher = Fetcher(self.cache, self.server.api())
+
+		weather = fetcher.fetch('32997', 'c')
+		self.assertEqual(weather['location']['city'], 'Reading')
+		self.assertTrue(self.cache.get('32997', 'c') is not None)
+
+		again = fetcher.fetch('32997', 'c')
+		self.assertEqual(again, weather)
+		self.assertEqual(self.server.stats.get(200), 1)
+		self.assertEqual(self.server.stats.get(304), 1)
+
+	def test_not_modified_from_disk(self):
+		Fetcher(self.cache, self.server.api()).fetch('32997', 'c')
+
+		cache = FeedCache(self.cache.cache_file)
+		cache.load()
+		weather = Fetcher(cache, self.server.api()).fetch('32997', 'c')
+		self.assertEqual(weather['location']['city'], 'Reading')
+		self.assertEqual(self.server.stats.get(304), 1)
+
+	def test_without_cache(self):
+		fetcher = Fetcher(api=self.server.api())
+
+		self.assertTrue(fetcher.fetch('32997', 'c') is not None)
+		self.assertTrue(fetcher.fetch('32997', 'c') is not None)
+		self.assertEqual(self.server.stats.get(200), 2)
+
+	def test_errors(self):
+		fetcher = Fetcher(self.cache, self.server.api())
+		self.assertTrue(fetcher.fetch('1', 'c') is None)
+		self.assertTrue(self.cache.get('1', 'c') is None)
+
+		self.server.faults.append(feedserver.Fault('error:503@1'))
+		self.assertTrue(fetcher.fetch('32997', 'c') is None)
+
+	def test_stall(self):
+		self.server.faults.append(feedserver.Fault('stall:5@1'))
+		fetcher = Fetcher(api=self.server.api(), timeout=0.5)
+
+		start = time.time()
+		self.assertTrue(fetcher.fetch('32997', 'c') is None)
+		self.assertTrue(time.time() - start < 2)
+
+
+class Results(object):
+	"""Dispatch for the pool that runs the callbacks in the test thread.
+	"""
+
+	def __init__(self):
+		self.queue = Queue.Queue()
+
+	def dispatch(self, callback, result):
+		self.queue.put((callback, result))
+
+	def run(self, count=1, timeout=5):
+		for i in range(count):
+			(callback, result) = self.queue.get(timeout=timeout)
+			callback(result)
+
+
+class FetchPoolTest(unittest.TestCase):
+
+	def test_burst(self):
+		pool = FetchPool(4)
+		done = []
+		lock = threading.Lock()
+
+		def callback(result):
+			with lock:
+				done.append(result)
+
+		start = time.time()
+		for i in range(4):
+			pool.submit(time.sleep, (0.5,), callback)
+		while len(done) < 4 and time.time() - start < 5:
+			time.sleep(0.05)
+
+		self.assertEqual(len(done), 4)
+		self.assertEqual(pool.workers, 4)
+		self.assertTrue(time.time() - start < 1.5)
+
+	def test_failed_fetch(self):
+		results = Results()
+		pool = FetchPool(1, results.dispatch)
+		done = []
+
+		pool.submit(lambda: 1/0, (), done.append)
+		results.run()
+		self.assertEqual(done, [None])
+
+
+class FetchCoordinatorTest(unittest.TestCase):
+
+	def setUp(self):
+		self.results = Results()
+		self.pool = FetchPool(4, self.results.dispatch)
+		self.fetches = []
+		self.release = threading.Event()
+
+	def fetch(self, w, c):
+		self.fetches.append((w, c))
+		self.release.wait(5)
+		if w == 'bad':
+			return None
+		return dict(w=w, c=c)
+
+	def test_in_flight(self):
+		coordinator = FetchCoordinator(self.fetch, self.pool)
+		done = []
+
+		coordinator.request('32997', 'c', done.append)
+		coordinator.request('32997', 'c', done.append)
+		self.release.set()
+		self.results.run()
+
+		self.assertEqual(self.fetches, [('32997', 'c')])
+		self.assertEqual(done, [dict(w='32997', c='c')]*2)
+
+	def test_fresh(self):
+		coordinator = FetchCoordinator(self.fetch, self.pool, fresh=60)
+		done = []
+		self.release.set()
+
+		coordinator.request('32997', 'c', done.append)
+		self.results.run()
+		coordinator.request('32997', 'c', done.append)
+		self.results.run()
+		self.assertEqual(len(self.fetches), 1)
+		self.assertEqual(len(done), 2)
+
+		coordinator.fresh = 0
+		coordinator.request('32997', 'c', done.append)
+		self.results.run()
+		self.assertEqual(len(self.fetches), 2)
+
+	def test_failures_are_not_reused(self):
+		coordinator = FetchCoordinator(self.fetch, self.pool, fresh=60)
+		done = []
+		self.release.set()
+
+		coordinator.request('bad', 'c', done.append)
+		self.results.run()
+		coordinator.request('bad', 'c', done.append)
+		self.results.run()
+		self.assertEqual(done, [None, None])
+		self.assertEqual(len(self.fetches), 2)
+
+	def test_request_many(self):
+		coordinator = FetchCoordinator(self.fetch, self.pool)
+		done = []
+		self.release.set()
+
+		coordinator.request_many([('32997', 'c'), ('bad', 'c'),
+			('32997', 'c')], done.append)
+		self.results.run(2)
+
+		self.assertEqual(done, [{('32997', 'c'): dict(w='32997', c='c'),
+			('bad', 'c'): None}])
+		self.assertEqual(len(self.fetches), 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
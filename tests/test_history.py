@@ -0,0 +1,241 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import math
+import unittest
+from array import array
+from StringIO import StringIO
+try:
+	import json
+except:
+	import simplejson as json
+
+from oraje import History, Trends, sparkline, convert_units
+from oraje.history import observation_time
+from oraje.trend import Ring
+
+from tests import observation
+
+try:
+	from oraje import stats
+except ImportError:
+	stats = None
+
+WOEID = '32997'
+
+class HistoryTest(unittest.TestCase):
+
+	def setUp(self):
+		self.history = History(':memory:')
+
+	def tearDown(self):
+		self.history.close()
+
+	def test_observation_time(self):
+		self.assertEqual(observation_time('Wed, 14 Dec 2011 6:50 pm GMT'),
+			1323888600)
+		self.assertEqual(observation_time('Thu, 15 Dec 2011 12:05 am GMT'),
+			1323907500)
+		self.assertEqual(observation_time('Thu, 15 Dec 2011 12:05 pm CET'),
+			1323950700)
+
+	def test_append(self):
+		weather = observation('Wed, 14 Dec 2011 6:50 pm GMT')
+
+		self.assertTrue(self.history.append(WOEID, weather))
+		# same observation time
+		self.assertFalse(self.history.append(WOEID, weather))
+
+		rows = self.history.range(WOEID)
+		self.assertEqual(len(rows), 1)
+		row = dict(zip(History.COLUMNS, rows[0]))
+		self.assertEqual(row['time'], 1323888600)
+		self.assertEqual(row['temp'], 8)
+		self.assertEqual(row['pressure'], 1006.1)
+		self.assertEqual(row['code'], 11)
+
+	def test_canonical_units(self):
+		weather = convert_units(observation('Wed, 14 Dec 2011 6:50 pm GMT'),
+			'f')
+		self.history.append(WOEID, weather)
+
+		row = dict(zip(History.COLUMNS, self.history.last(WOEID, 1)[0]))
+		self.assertEqual(row['temp'], 8)
+		self.assertAlmostEqual(row['pressure'], 1006.1, 0)
+
+	def test_missing_values(self):
+		self.history.append(WOEID, observation('Wed, 14 Dec 2011 6:50 pm GMT',
+			wind_chill=''))
+
+		row = dict(zip(History.COLUMNS, self.history.last(WOEID, 1)[0]))
+		self.assertTrue(row['chill'] is None)
+
+	def test_range_and_last(self):
+		for hour in range(1, 6):
+			self.history.append(WOEID, observation(
+				'Wed, 14 Dec 2011 %d:00 pm GMT' % hour))
+		self.history.append('766273', observation(
+			'Wed, 14 Dec 2011 1:00 pm GMT'))
+
+		start = observation_time('Wed, 14 Dec 2011 2:00 pm GMT')
+		end = observation_time('Wed, 14 Dec 2011 4:00 pm GMT')
+		self.assertEqual([row[0] for row in self.history.range(WOEID,
+			start, end)], [start, start + 3600])
+
+		last = self.history.last(WOEID, 2)
+		self.assertEqual([row[0] for row in last], [end, end + 3600])
+		self.assertEqual(len(self.history.range('766273')), 1)
+
+
+class RingTest(unittest.TestCase):
+
+	def test_ring(self):
+		ring = Ring(3)
+		self.assertEqual(len(ring), 0)
+		self.assertEqual(list(ring.values()), [])
+
+		ring.append(1)
+		ring.append(2)
+		self.assertEqual(list(ring.values()), [1, 2])
+
+		for value in (3, 4, 5):
+			ring.append(value)
+		self.assertEqual(len(ring), 3)
+		self.assertEqual(list(ring.values()), [3, 4, 5])
+		self.assertTrue(isinstance(ring.values(), array))
+
+
+class TrendsTest(unittest.TestCase):
+
+	def test_append(self):
+		trends = Trends(4)
+		self.assertTrue(trends.append(observation(
+			'Wed, 14 Dec 2011 6:50 pm GMT', condition_temp='8')))
+		# not newer
+		self.assertFalse(trends.append(observation(
+			'Wed, 14 Dec 2011 6:50 pm GMT', condition_temp='9')))
+		self.assertTrue(trends.append(observation(
+			'Wed, 14 Dec 2011 7:50 pm GMT', condition_temp='9')))
+
+		self.assertEqual(list(trends.rings['temp'].values()), [8, 9])
+		self.assertEqual(list(trends.rings['pressure'].values()),
+			[1006.1, 1006.1])
+
+	def test_seed(self):
+		history = History(':memory:')
+		for hour in range(1, 7):
+			history.append(WOEID, observation(
+				'Wed, 14 Dec 2011 %d:00 pm GMT' % hour,
+				condition_temp=str(hour)))
+
+		trends = Trends(4)
+		trends.seed(history.last(WOEID, 4))
+		self.assertEqual(list(trends.rings['temp'].values()), [3, 4, 5, 6])
+
+		# already seeded
+		self.assertFalse(trends.append(observation(
+			'Wed, 14 Dec 2011 6:00 pm GMT')))
+		history.close()
+
+	def test_sparkline(self):
+		self.assertEqual(len(sparkline(array('d', [1.0]), 100, 20)), 0)
+
+		points = [tuple(point) for point in
+			sparkline(array('d', [1.0, 3.0, 2.0]), 104, 24)]
+		self.assertEqual(points, [(2, 22), (52, 2), (102, 12)])
+
+		# flat
+		points = [tuple(point) for point in
+			sparkline(array('d', [5.0, 5.0]), 104, 24)]
+		self.assertEqual(points, [(2, 22), (102, 22)])
+
+
+@unittest.skipIf(stats is None, 'requires numpy')
+class StatisticsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.history = History(':memory:')
+		for date, temp in (('Wed, 14 Dec 2011 1:00 pm GMT', '4'),
+			('Wed, 14 Dec 2011 2:00 pm GMT', '8'),
+			('Wed, 14 Dec 2011 3:00 pm GMT', '6'),
+			('Thu, 15 Dec 2011 1:00 pm GMT', '2')):
+			self.history.append(WOEID, observation(date, condition_temp=temp,
+				wind_chill=''))
+
+	def tearDown(self):
+		self.history.close()
+
+	def test_daily(self):
+		statistics = stats.Statistics(self.history)
+		days = statistics.daily(WOEID)
+
+		self.assertEqual([day for day, values in days], [15322, 15323])
+		self.assertEqual(days[0][1]['temp'], (4, 8, 6))
+		self.assertEqual(days[1][1]['temp'], (2, 2, 2))
+		self.assertEqual(days[0][1]['pressure'], (1006.1, 1006.1, 1006.1))
+		self.assertTrue(all(math.isnan(value)
+			for value in days[0][1]['chill']))
+
+		self.assertEqual(statistics.daily('766273'), [])
+
+	def test_incremental(self):
+		statistics = stats.Statistics(self.history)
+		statistics.daily(WOEID)
+		cached = statistics.cache[(int(WOEID), 15322)]
+
+		self.history.append(WOEID, observation('Thu, 15 Dec 2011 2:00 pm GMT',
+			condition_temp='4'))
+		days = statistics.daily(WOEID)
+
+		self.assertTrue(statistics.cache[(int(WOEID), 15322)] is cached)
+		self.assertEqual(days[1][1]['temp'], (2, 4, 3))
+		self.assertEqual(len(statistics.load(WOEID)), 5)
+
+	def test_rolling(self):
+		statistics = stats.Statistics(self.history)
+		(times, averages) = statistics.rolling(WOEID, 'temp', 2*3600)
+
+		self.assertEqual(len(times), 4)
+		self.assertEqual(list(averages), [4, 6, 7, 2])
+
+	def test_tendency(self):
+		statistics = stats.Statistics(self.history)
+		self.assertAlmostEqual(statistics.tendency(WOEID), 0)
+
+		self.history.append(WOEID, observation('Thu, 15 Dec 2011 4:00 pm GMT',
+			atmosphere_pressure='1000.1'))
+		# interpolated between 1006.1 at 1 pm and 1000.1 at 4 pm
+		self.assertAlmostEqual(statistics.tendency(WOEID, 3600), -2)
+		self.assertTrue(statistics.tendency(WOEID, 30*86400) is None)
+
+	def test_report(self):
+		output = StringIO()
+		self.assertEqual(stats.report(self.history, WOEID, output), 2)
+
+		lines = [json.loads(line) for line in output.getvalue().splitlines()]
+		self.assertEqual(lines[0]['day'], '2011-12-14')
+		self.assertEqual(lines[0]['temp'], dict(min=4, max=8, mean=6))
+		self.assertEqual(lines[0]['chill'], dict(min=None, max=None,
+			mean=None))
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
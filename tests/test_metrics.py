@@ -0,0 +1,108 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+from StringIO import StringIO
+
+from oraje.metrics import BUCKETS, Histogram, Registry, NULL_TIMER
+
+class HistogramTest(unittest.TestCase):
+
+	def test_buckets(self):
+		histogram = Histogram()
+		for seconds in (0, 1e-6, 1.5e-6, 3e-6, 1e-3, 1e6):
+			histogram.observe(seconds)
+
+		self.assertEqual(histogram.buckets[0], 1)
+		# [1, 2) us
+		self.assertEqual(histogram.buckets[1], 2)
+		# [2, 4) us
+		self.assertEqual(histogram.buckets[2], 1)
+		# 1000 us is in [512, 1024)
+		self.assertEqual(histogram.buckets[10], 1)
+		# anything longer goes to the last bucket
+		self.assertEqual(histogram.buckets[BUCKETS - 1], 1)
+		self.assertEqual(histogram.count, 6)
+		self.assertEqual(histogram.max, 1e6)
+
+	def test_percentile(self):
+		histogram = Histogram()
+		self.assertEqual(histogram.percentile(0.5), 0)
+
+		for i in range(90):
+			histogram.observe(10e-6)
+		for i in range(10):
+			histogram.observe(5e-3)
+
+		self.assertEqual(histogram.percentile(0.5), 16e-6)
+		self.assertEqual(histogram.percentile(0.9), 16e-6)
+		# capped by the maximum
+		self.assertEqual(histogram.percentile(0.99), 5e-3)
+
+	def test_snapshot(self):
+		histogram = Histogram()
+		histogram.observe(1e-3)
+		histogram.observe(3e-3)
+
+		snapshot = histogram.snapshot()
+		self.assertEqual(snapshot['count'], 2)
+		self.assertAlmostEqual(snapshot['mean'], 2e-3)
+		self.assertEqual(snapshot['max'], 3e-3)
+
+
+class RegistryTest(unittest.TestCase):
+
+	def test_disabled(self):
+		registry = Registry()
+		registry.count('requests')
+		registry.observe('parse', 1e-3)
+
+		self.assertTrue(registry.timer('parse') is NULL_TIMER)
+		self.assertEqual(registry.snapshot(), dict(counters=dict(),
+			histograms=dict()))
+
+	def test_enabled(self):
+		registry = Registry(True)
+		registry.count('requests')
+		registry.count('requests', 2)
+		with registry.timer('parse'):
+			pass
+
+		@registry.timed('call')
+		def call(value):
+			return value
+		self.assertEqual(call(1), 1)
+
+		snapshot = registry.snapshot()
+		self.assertEqual(snapshot['counters'], dict(requests=3))
+		self.assertEqual(sorted(snapshot['histograms']), ['call', 'parse'])
+		self.assertEqual(snapshot['histograms']['call']['count'], 1)
+
+		output = StringIO()
+		registry.dump(output)
+		self.assertEqual(len(output.getvalue().splitlines()), 3)
+
+		registry.reset()
+		self.assertEqual(registry.snapshot()['counters'], dict())
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
@@ -0,0 +1,187 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+
+from oraje import PollScheduler, CircuitBreaker
+
+from tests import observation
+
+class Clock(object):
+	"""Manual clock, in seconds.
+	"""
+
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+	def advance(self, minutes):
+		self.now += minutes*60
+
+
+class PollSchedulerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.clock = Clock()
+		self.changes = 0
+
+	def poll(self, scheduler, changes, ttl='60'):
+		"""Polls at the scheduler's interval, changes says if the weather
+		changed since the previous poll. Returns the intervals.
+		"""
+
+		intervals = []
+		for changed in changes:
+			self.clock.advance(scheduler.interval)
+			if changed:
+				self.changes += 1
+			weather = observation('Wed, 14 Dec 2011 %d:%02d pm GMT' %
+				(1 + self.changes//60, self.changes % 60), channel_ttl=ttl)
+			intervals.append(scheduler.update(weather))
+		return intervals
+
+	def test_first_sample(self):
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		self.assertEqual(self.poll(scheduler, [True]), [15])
+
+	def test_stretch(self):
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		intervals = self.poll(scheduler, [False]*8, ttl='0')
+
+		self.assertEqual(intervals[:3], [15, 22.5, 33.75])
+		self.assertEqual(intervals[-1], 60)
+
+	def test_shrink(self):
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		intervals = self.poll(scheduler, [True]*8, ttl='0')
+
+		self.assertEqual(intervals[1], 7.5)
+		self.assertEqual(intervals[-1], 5)
+
+	def test_ttl(self):
+		# a TTL below the base interval is a lower bound
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		intervals = self.poll(scheduler, [True]*8, ttl='10')
+		self.assertEqual(intervals[-1], 10)
+
+		# but it can't override the user's base interval
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		intervals = self.poll(scheduler, [True]*8, ttl='60')
+		self.assertEqual(intervals[-1], 5)
+
+	def test_close_samples(self):
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		self.poll(scheduler, [True, True], ttl='0')
+		interval = scheduler.interval
+
+		# ie. a manual refresh right after a scheduled poll
+		self.clock.advance(1)
+		scheduler.update(observation('Thu, 15 Dec 2011 1:00 am GMT'))
+		self.assertEqual(scheduler.interval, interval)
+
+	def test_latency(self):
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		self.poll(scheduler, [True]*8, ttl='0')
+		self.assertEqual(scheduler.interval, 5)
+
+		# polls at the minimum arriving a bit early are still sampled
+		self.clock.advance(4.9)
+		scheduler.update(observation('Thu, 15 Dec 2011 1:00 am GMT'))
+		self.assertEqual(scheduler.last_time, self.clock.now)
+		self.assertEqual(scheduler.last[0], 'Thu, 15 Dec 2011 1:00 am GMT')
+
+	def test_not_adaptive(self):
+		scheduler = PollScheduler(15, 5, 60, adaptive=False,
+			clock=self.clock)
+		intervals = self.poll(scheduler, [True, False]*4, ttl='0')
+		self.assertEqual(intervals, [15]*8)
+
+	def test_set_base(self):
+		scheduler = PollScheduler(15, 5, 60, clock=self.clock)
+		self.poll(scheduler, [False]*4, ttl='0')
+		scheduler.set_base(30)
+		self.assertEqual(scheduler.interval, 30)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.clock = Clock()
+		self.breaker = CircuitBreaker(base=30, maximum=900, threshold=3,
+			cooldown=1800, clock=self.clock)
+
+	def test_backoff(self):
+		for backoff in (30, 60, 120):
+			self.assertTrue(self.breaker.allow())
+			self.breaker.failure()
+			if self.breaker.state == CircuitBreaker.CLOSED:
+				delay = self.breaker.delay()
+				self.assertTrue(backoff/2.0 <= delay <= backoff)
+
+		self.breaker.success()
+		self.assertEqual(self.breaker.failures, 0)
+		self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+	def test_maximum(self):
+		self.breaker.threshold = 100
+		for i in range(20):
+			self.breaker.failure()
+		self.assertTrue(self.breaker.delay() <= 900)
+
+	def test_open(self):
+		for i in range(3):
+			self.breaker.failure()
+		self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+		self.assertFalse(self.breaker.allow())
+		self.assertTrue(1800 <= self.breaker.delay() <= 1830)
+
+		self.clock.advance(20)
+		self.assertFalse(self.breaker.allow())
+		self.assertTrue(600 <= self.breaker.delay() <= 630)
+
+	def test_half_open(self):
+		for i in range(3):
+			self.breaker.failure()
+		self.clock.advance(30)
+
+		# a single probe
+		self.assertTrue(self.breaker.allow())
+		self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+		self.assertFalse(self.breaker.allow())
+
+		# that fails
+		self.breaker.failure()
+		self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+		self.assertFalse(self.breaker.allow())
+
+		# and then succeeds
+		self.clock.advance(30)
+		self.assertTrue(self.breaker.allow())
+		self.breaker.success()
+		self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+		self.assertTrue(self.breaker.allow())
+		self.assertTrue(self.breaker.allow())
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
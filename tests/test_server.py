@@ -0,0 +1,163 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+import unittest
+
+from oraje import Fetcher
+from oraje.server import SnapshotStore, SnapshotServer
+
+from tests import recorded
+
+class Clock(object):
+
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+
+class Upstream(object):
+	"""Fetcher stand-in, WOEIDs in bad fail.
+	"""
+
+	def __init__(self):
+		self.fetches = []
+		self.bad = set()
+		self.during = None
+
+	def fetch(self, w, c):
+		self.fetches.append(w)
+		if self.during is not None:
+			self.during(w)
+		if w in self.bad:
+			return None
+		return dict(w=w, c=c)
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.clock = Clock()
+		self.upstream = Upstream()
+		self.store = SnapshotStore(self.upstream, ttl=900, clock=self.clock,
+			retry=60, size=8)
+
+	def test_ttl(self):
+		snapshot = self.store.get('1', 'c')
+		self.assertEqual(snapshot[1], '{"c": "c", "w": "1"}')
+		self.assertTrue(self.store.get('1', 'c') is snapshot)
+
+		self.clock.now = 899
+		self.assertTrue(self.store.get('1', 'c') is snapshot)
+		self.clock.now = 900
+		self.assertFalse(self.store.get('1', 'c') is snapshot)
+		self.assertEqual(self.upstream.fetches, ['1', '1'])
+
+	def test_retry(self):
+		self.upstream.bad.add('1')
+		self.assertTrue(self.store.get('1', 'c') is None)
+		self.assertTrue(self.store.get('1', 'c') is None)
+		self.assertEqual(self.upstream.fetches, ['1'])
+
+		self.clock.now = 60
+		self.upstream.bad.clear()
+		self.assertTrue(self.store.get('1', 'c') is not None)
+		self.assertEqual(self.upstream.fetches, ['1', '1'])
+
+	def test_stale(self):
+		snapshot = self.store.get('1', 'c')
+		self.upstream.bad.add('1')
+
+		self.clock.now = 1000
+		self.assertTrue(self.store.get('1', 'c') is snapshot)
+		self.assertTrue(self.store.get('1', 'c') is snapshot)
+		self.assertEqual(self.upstream.fetches, ['1', '1'])
+
+	def test_eviction(self):
+		self.store.pin('0', 'c')
+		for w in range(20):
+			self.clock.now += 1
+			self.store.get(str(w), 'c')
+			self.store.get('0', 'c')
+
+		self.assertTrue(len(self.store.locks) <= 8)
+		self.assertEqual(set(self.store.snapshots), set(self.store.locks))
+		self.assertTrue(('0', 'c') in self.store.snapshots)
+		self.assertTrue(('19', 'c') in self.store.snapshots)
+		self.assertFalse(('1', 'c') in self.store.snapshots)
+
+	def test_no_eviction_while_fetching(self):
+		def during(w):
+			if w == 'slow':
+				for other in range(20):
+					self.clock.now += 1
+					self.store.get(str(other), 'c')
+		self.upstream.during = during
+
+		self.store.get('slow', 'c')
+
+		self.assertTrue(('slow', 'c') in self.store.locks)
+		self.assertEqual(set(self.store.snapshots), set(self.store.locks))
+		self.assertEqual(self.store.fetching, dict())
+
+	def test_single_fetch(self):
+		release = threading.Event()
+		self.upstream.during = lambda w: release.wait(5)
+
+		threads = [threading.Thread(target=self.store.get, args=('1', 'c'))
+			for i in range(4)]
+		for thread in threads:
+			thread.start()
+		release.set()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(self.upstream.fetches, ['1'])
+
+
+class SnapshotServerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.upstream = Upstream()
+		self.upstream.fetch = lambda w, c: w == '32997' and recorded(w) or None
+		self.server = SnapshotServer(('127.0.0.1', 0),
+			SnapshotStore(self.upstream))
+		thread = threading.Thread(target=self.server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_fetch(self):
+		fetcher = Fetcher(api='http://%s:%d/weather?w=%%s&u=%%s' %
+			self.server.server_address)
+
+		self.assertEqual(fetcher.fetch('32997', 'c'), recorded('32997'))
+		self.assertTrue(fetcher.fetch('1', 'c') is None)
+		self.assertTrue(fetcher.fetch('x', 'c') is None)
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
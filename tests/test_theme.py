@@ -0,0 +1,141 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import marshal
+import tempfile
+import unittest
+try:
+	import json
+except:
+	import simplejson as json
+
+from oraje import Theme
+
+from tests import TOP_DIR
+
+class CountingTheme(Theme):
+	"""Theme that counts the compilations.
+	"""
+
+	compiled = 0
+
+	@classmethod
+	def compile(cls, theme_file):
+		cls.compiled += 1
+		return super(CountingTheme, cls).compile(theme_file)
+
+
+class ThemeTest(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.theme_file = os.path.join(self.tmp_dir, 'theme.json')
+		self.compiled_file = os.path.join(self.tmp_dir, 'theme.compiled')
+		shutil.copy(os.path.join(TOP_DIR, 'theme.json'), self.theme_file)
+		CountingTheme.compiled = 0
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp_dir)
+
+	def load(self):
+		return CountingTheme.load(self.theme_file, self.compiled_file)
+
+	def test_compile(self):
+		theme = Theme.compile(self.theme_file)
+
+		self.assertTrue(theme.has(11))
+		self.assertTrue(theme.has('3200'))
+		self.assertFalse(theme.has(48))
+		self.assertFalse(theme.has('x'))
+		self.assertEqual(theme.status(0), 'severe-alert')
+		self.assertEqual(theme.desc(0), 'tornado')
+		self.assertEqual(theme.icon(0),
+			'/usr/share/OrajeApplet/weather-severe-alert.svg')
+
+	def test_invalid(self):
+		theme_fd = open(self.theme_file, 'w')
+		json.dump(dict(base='/', status=dict(clear='clear.svg'),
+			conditions={'99': dict(status='clear')}), theme_fd)
+		theme_fd.close()
+		self.assertRaises(ValueError, Theme.compile, self.theme_file)
+
+		theme_fd = open(self.theme_file, 'w')
+		json.dump(dict(base='/', status=dict()), theme_fd)
+		theme_fd.close()
+		self.assertRaises(ValueError, Theme.compile, self.theme_file)
+
+	def test_load(self):
+		theme = self.load()
+		self.assertEqual(CountingTheme.compiled, 1)
+		self.assertTrue(os.path.exists(self.compiled_file))
+
+		again = self.load()
+		self.assertEqual(CountingTheme.compiled, 1)
+		self.assertEqual(again.conditions, theme.conditions)
+		self.assertEqual(again.icons, theme.icons)
+
+	def test_modified(self):
+		self.load()
+		mtime = os.stat(self.theme_file).st_mtime
+		os.utime(self.theme_file, (mtime + 10, mtime + 10))
+
+		self.load()
+		self.assertEqual(CountingTheme.compiled, 2)
+		# and the new one is stored
+		self.load()
+		self.assertEqual(CountingTheme.compiled, 2)
+
+	def test_other_theme(self):
+		self.load()
+		other_file = os.path.join(self.tmp_dir, 'other.json')
+		shutil.copy(self.theme_file, other_file)
+
+		theme = CountingTheme.load(other_file, self.compiled_file)
+		self.assertEqual(CountingTheme.compiled, 2)
+		self.assertEqual(theme.theme_file, other_file)
+
+	def test_version(self):
+		self.load()
+		compiled_fd = open(self.compiled_file, 'rb')
+		data = marshal.load(compiled_fd)
+		compiled_fd.close()
+
+		compiled_fd = open(self.compiled_file, 'wb')
+		marshal.dump((Theme.VERSION - 1,) + data[1:], compiled_fd)
+		compiled_fd.close()
+
+		self.load()
+		self.assertEqual(CountingTheme.compiled, 2)
+
+	def test_broken(self):
+		for content in ('', 'broken', marshal.dumps((1, 2))):
+			compiled_fd = open(self.compiled_file, 'wb')
+			compiled_fd.write(content)
+			compiled_fd.close()
+
+			self.assertTrue(self.load().has(11))
+		self.assertEqual(CountingTheme.compiled, 3)
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF
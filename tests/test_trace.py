@@ -0,0 +1,139 @@
+# coding: utf-8
+#
+# Oraje Applet - Another Weather Applet for Gnome
+# Copyright (C) 2010 Juan J. Martinez <jjm@usebox.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+try:
+	import json
+except:
+	import simplejson as json
+
+from oraje import trace
+from oraje import FetchPool, FetchCoordinator
+
+class TraceTest(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.log_file = os.path.join(self.tmp_dir, 'trace.log')
+		trace.configure(self.log_file, 1.0)
+
+	def tearDown(self):
+		for handler in list(trace.logger.handlers):
+			trace.logger.removeHandler(handler)
+			handler.close()
+		trace._sample = 0.0
+		shutil.rmtree(self.tmp_dir)
+
+	def lines(self):
+		log_fd = open(self.log_file, 'r')
+		lines = [json.loads(line) for line in log_fd]
+		log_fd.close()
+		return lines
+
+	def spans(self):
+		return dict((span['name'], span) for span in self.lines())
+
+	def test_tree(self):
+		root = trace.start('refresh', locations=2)
+		with root.child('fetch', woeid='32997'):
+			with trace.span('parse') as span:
+				span.set(ok=True)
+		root.end()
+
+		spans = self.spans()
+		self.assertEqual(sorted(spans), ['fetch', 'parse', 'refresh'])
+		self.assertEqual(len(set(span['trace'] for span in spans.values())),
+			1)
+		self.assertTrue(spans['refresh']['parent'] is None)
+		self.assertEqual(spans['fetch']['parent'], spans['refresh']['span'])
+		self.assertEqual(spans['parse']['parent'], spans['fetch']['span'])
+		self.assertEqual(spans['parse']['attrs'], dict(ok=True))
+		self.assertEqual(spans['refresh']['attrs']['locations'], 2)
+		self.assertTrue('host' in spans['refresh']['attrs'])
+
+	def test_no_active_span(self):
+		self.assertTrue(trace.span('parse') is trace.NULL_SPAN)
+
+		root = trace.start('refresh').activate()
+		self.assertFalse(trace.span('parse') is trace.NULL_SPAN)
+		root.end()
+		self.assertTrue(trace.span('parse') is trace.NULL_SPAN)
+
+	def test_error(self):
+		root = trace.start('refresh')
+		try:
+			with root.child('fetch'):
+				raise IOError('timed out')
+		except IOError:
+			pass
+		root.end()
+
+		self.assertEqual(self.spans()['fetch']['attrs']['error'],
+			'IOError: timed out')
+
+	def test_traced(self):
+		@trace.traced('call')
+		def call(value):
+			return value
+
+		root = trace.start('refresh').activate()
+		self.assertEqual(call(1), 1)
+		root.end()
+
+		self.assertEqual(self.spans()['call']['parent'],
+			self.spans()['refresh']['span'])
+
+	def test_not_sampled(self):
+		trace._sample = 0.0
+		root = trace.start('refresh')
+		self.assertTrue(root is trace.NULL_SPAN)
+		with root.child('fetch'):
+			pass
+		root.end()
+
+		self.assertEqual(self.spans(), dict())
+
+	def test_coordinator(self):
+		pool = FetchPool(2)
+		coordinator = FetchCoordinator(lambda w, c: dict(w=w), pool)
+		done = threading.Event()
+
+		root = trace.start('refresh')
+		coordinator.request_many([('1', 'c'), ('2', 'c')],
+			lambda results: done.set(), root)
+		done.wait(5)
+		root.end()
+		# traced without a parent
+		coordinator.request('3', 'c', lambda weather: None)
+
+		spans = self.lines()
+		self.assertEqual(sorted(span['name'] for span in spans),
+			['fetch', 'fetch', 'refresh'])
+		self.assertEqual(set(span['parent'] for span in spans
+			if span['name'] == 'fetch'), set([spans[-1]['span']]))
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+# EOF